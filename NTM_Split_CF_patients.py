@@ -8,6 +8,8 @@
 import string
 import sys, re, os, getopt
 import math
+from NTM_read_data import OpenRecords, OpenWriter, BufferedStdout
+from NTM_metrics import StartMetrics
 
 ###############################################################################
 
@@ -17,6 +19,9 @@ def Usage():
 	print '\t      -c <id file>  each row contains a patient id in first column.  (CSV format)'
 	print '\t      -r   remove records from source data that have a matching id.'
 	print '\t      -m   collect records from source data that have a matching id. (DEFAULT)'
+	print '\t      -M <filename>  write records that have a matching id to filename.'
+	print '\t      -R <filename>  write records that do not have a matching id to filename.'
+	print '\t           With -M and/or -R, the source data is partitioned in a single pass and nothing is written to stdout.'
 	print '\n'
 # end of Usage()
 
@@ -24,19 +29,20 @@ def Usage():
 
 ###############################################################################
 # 	Read the records in the file and extract the id from first column.
+#	Returns the set of ids.
 ###############################################################################
 def ReadIdFile(filename):
-	result = {}
+	result = set()
 	
 	with open(filename, 'r') as infile:
 #		header = infile.readline()
-		for line in infile.readlines():
+		for line in infile:
 			fields = line.split(',')
 
 			id = fields[0].strip()
 			id = id.upper()
 
-			result[id] = line
+			result.add(id)
 
 	return result
 
@@ -147,12 +153,16 @@ def Main():
 
 	global match
 	
+	metrics = StartMetrics()
+	
 	id_filename = None 
+	match_filename = None
+	remove_filename = None
 
 	match = True
 			
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "rmc:", ["help"])
+		opts, args = getopt.getopt(sys.argv[1:], "rmc:M:R:", ["help"])
 	except getopt.GetoptError:
 		Usage()
 		sys.exit(1)
@@ -162,6 +172,8 @@ def Main():
 		if	 opt == '-m':			match = True
 		elif opt == '-r':			match = False
 		elif opt == '-c':			id_filename = value
+		elif opt == '-M':			match_filename = value
+		elif opt == '-R':			remove_filename = value
 		else: 
 			print "Unhandled opt [%s][%s]"%(opt,value)
 
@@ -172,50 +184,61 @@ def Main():
 	ids = ReadIdFile(id_filename)
 	sys.stderr.write("%d ids in file [%s]\n"%(len(ids),id_filename))
 			
-	# open a filename given on the command line.
-	fh=open(args[0])
 
-	line_no = 0
-	current_patient = ""
-	records = []
 	n_patients = 0
 	n_records = 0
 	n_ids_written = 0
 	
-	for line in fh.readlines():
-		line = line.strip()
-		if (len(line) < 2):		continue
-		if (line[0] == '#'):	continue
-				
-		line_no += 1
-		line = line.upper()
-		cols = line.split(',')
+	if (match_filename or remove_filename):
+		# partition the patients into the matching and non-matching outputs
+		#	outputs[True] gets the matching patients, outputs[False] the others
+		outputs = {True: None, False: None}
+		if (match_filename):
+			outputs[True] = OpenWriter(match_filename)
+		if (remove_filename):
+			outputs[False] = OpenWriter(remove_filename)
+		n_written = {True: 0, False: 0}
+		n_records = {True: 0, False: 0}
 
-		if cols[0] != current_patient:
-			if (len(records) > 0):
-				n_patients += 1
-				
-				if (match and ids.has_key(current_patient)) or (not match and not ids.has_key(current_patient)) :
-					# write out records
-					n_ids_written += 1
-					for rec in records: 		
-						print ",".join(rec)
-					n_records += len(records)
-							
-			current_patient = cols[0].upper()
-			records = []
-			
-		records.append(cols)	
-	
-	if (len(records) > 0):
+		for records in OpenRecords(args[0], skip_comments=True).Patients():
+			metrics.Switch("write")
+			n_patients += 1
+			matches = records[0][0] in ids
+			out = outputs[matches]
+			if (out):
+				n_written[matches] += 1
+				for rec in records:
+					out.Write(rec)
+				n_records[matches] += len(records)
+
+		for out in outputs.values():
+			if (out):
+				out.Close()
+
+		sys.stderr.write("# Patients processed: %d\n"%n_patients)
+		if (match_filename):
+			sys.stderr.write("# Patients written:   %d [%s]\n"%(n_written[True], match_filename))
+			sys.stderr.write("# Records written:    %d [%s]\n"%(n_records[True], match_filename))
+		if (remove_filename):
+			sys.stderr.write("# Patients written:   %d [%s]\n"%(n_written[False], remove_filename))
+			sys.stderr.write("# Records written:    %d [%s]\n"%(n_records[False], remove_filename))
+		return
+
+	# open a filename given on the command line.
+	output = OpenWriter(None)
+	for records in OpenRecords(args[0], skip_comments=True).Patients():
+		metrics.Switch("write")
+		current_patient = records[0][0]
 		n_patients += 1
-		if (match and ids.has_key(current_patient)) or (not match and not ids.has_key(current_patient)) :
+		
+		if (match and current_patient in ids) or (not match and current_patient not in ids) :
 			# write out records
 			n_ids_written += 1
 			for rec in records: 		
-				print ",".join(rec)
+				output.Write(rec)
 			n_records += len(records)
 			
+	output.Close()
 				
 	sys.stderr.write("# Patients processed: %d\n"%n_patients)
 	sys.stderr.write("# Patients written:   %d\n"%n_ids_written)
@@ -226,8 +249,8 @@ def Main():
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	
@@ -0,0 +1,448 @@
+# Aggregation of NTM patient data for each ZCTA
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The patients of the source data are categorized once, and each patient
+#	is added to every output whose category it matches.  The view of an
+#	output selects what is written for each ZCTA:
+#
+#		counts	number of patients						(NTM_ZCTA_category_counts.py)
+#		data	number of patients, mean age, % female and % married
+#														(NTM_ZCTA_category_data.py)
+#		age		number of patients, with an age, 65+ and <65
+#														(NTM_ZCTA_category_data2.py)
+#		attr	a row for each patient with its state, age group and gender
+#														(NTM_ZCTA_category_data3.py)
+#
+#	All the views of all the categories can be written from a single pass of
+#	the source data, e.g.
+#
+#		python NTM_ZCTA_category_aggregate.py -h -C RAPID_SLOW_CATEGORIES.txt \
+#			-w data:ANY=any_data.csv -w data:1=rapid_data.csv \
+#			-w attr:ANY=any_attr.csv -w attr:1=rapid_attr.csv \
+#			multi_per_patient_diagnosed.csv
+#
+#	Columns of the input:
+#		0	ASID
+#		1	Date of diagnosis
+#		2	Species diagnosed
+#		3	Method of diagnosis
+#		4	Current Age
+#		5	Gender of Subject
+#		6	Ethnicity of subject
+#		7	City
+#		8	State
+#		9	ZIP
+#		10	Marital Status
+#
+
+import string
+import sys, re, os, getopt
+import array
+from NTM_read_data import OpenRecords, BufferedStdout
+from NTM_zcta import LoadZCTA, Lookup_ZCTA, Lookup_ZCTA_State
+from NTM_categories import LoadCategories, CategoryMasks, PatientCategories, PatientMatches, ParseSelector
+import NTM_metrics
+import NTM_diagnostics
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] -C <catagories file> -w <view>:<category>=<filename> ... <source data> \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t This application collects data for patients within each ZCTA, for several views and categories in a single pass.\n')
+	sys.stderr.write( '\t      -C <filename>  load catagories from given filename [ default: SPECIES_CATEGORIES.TXT]\n')
+	sys.stderr.write( '\t      -Z <filename>  load ZIP to ZCTA conversion data from given filename [default: zipcodezctatable.txt]\n')
+	sys.stderr.write( '\t      -h   write column headers to the output\n')
+	sys.stderr.write( '\t      -s   add column for "STATE" to the counts outputs\n')
+	sys.stderr.write( '\t      -w <view>:<category>=<filename>  write the view of the patients with the category to filename.\n')
+	sys.stderr.write( '\t           view is %s, category is a 1 based category number, ANY or OTHER.\n'%(", ".join(VIEW_NAMES)))
+	sys.stderr.write( '\t           May be repeated.  A filename of - writes to stdout.\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# ZctaTotals - totals of the patients in each ZCTA.  Each total is an array
+#	with one entry per ZCTA, at the index of the ZCTA in zctas.
+###############################################################################
+class ZctaTotals(object):
+
+	def __init__(self, n_totals):
+		self.zctas = {}
+		self.totals = [array.array('l') for i in range(n_totals)]
+
+	# Returns: the index of the totals of the ZCTA
+	def Index(self, zcta):
+		i = self.zctas.get(zcta)
+		if (i == None):
+			i = len(self.zctas)
+			self.zctas[zcta] = i
+			for total in self.totals:
+				total.append(0)
+		return i
+
+	def Sum(self, total):
+		return sum(self.totals[total])
+
+# end of ZctaTotals
+
+###############################################################################
+# CountsSink - number of patients in each ZCTA
+###############################################################################
+
+N_CASES		= 0		# number of patients
+
+class CountsSink(ZctaTotals):
+
+	def __init__(self, write_state=False):
+		ZctaTotals.__init__(self, 1)
+		self.write_state = write_state
+
+	def Add(self, zcta, rec):
+		self.totals[N_CASES][self.Index(zcta)] += 1
+
+	def Write(self, out, cat_name, write_header):
+		header = "ZCTA, %s"%cat_name
+		if (self.write_state):
+			header += ", STATE"
+		if (write_header):
+			out.write(header + "\n")
+		for zcta in sorted(self.zctas):
+			i = self.zctas[zcta]
+			if (self.write_state):
+				state = Lookup_ZCTA_State(zcta)
+				out.write("%s, %d, %s\n"%(zcta, self.totals[N_CASES][i], state))
+			else:
+				out.write("%s, %d\n"%(zcta, self.totals[N_CASES][i]))
+
+# end of CountsSink
+
+###############################################################################
+# DemographicsSink - number of patients, mean age, % female and % married
+#	of the patients in each ZCTA
+###############################################################################
+
+AGE_SUM		= 1		# sum of ages
+N_AGES		= 2		# number of patients with an age
+N_GENDER	= 3		# number of patients with a gender
+N_FEMALE	= 4		# number of female patients
+N_MARITAL	= 5		# number of patients with a marital status
+N_MARRIED	= 6		# number of married patients
+
+class DemographicsSink(ZctaTotals):
+
+	def __init__(self):
+		ZctaTotals.__init__(self, 7)
+
+	def Add(self, zcta, rec):
+		totals = self.totals
+		i = self.Index(zcta)
+
+		totals[N_CASES][i] += 1
+
+		try:
+			if rec[4].strip() != '':
+				totals[AGE_SUM][i] += int(rec[4])
+				totals[N_AGES][i] += 1
+		except:
+			NTM_diagnostics.current.Report("bad age", rec[0], "\nError: bad age field [%s] for record [%s].\n", rec[4], rec[0])
+
+		if rec[5].strip() != '':
+			totals[N_GENDER][i] += 1
+			if rec[5].strip().upper()[0] == 'F':
+				totals[N_FEMALE][i] += 1
+
+		if rec[10].strip() != '':
+			totals[N_MARITAL][i] += 1
+			if rec[10].strip().upper() == 'MARRIED':
+				totals[N_MARRIED][i] += 1
+
+	def Write(self, out, cat_name, write_header):
+		totals = self.totals
+		if (write_header):
+			out.write("ZCTA, %s, Avg Age, %% female, %% married\n"%cat_name)
+		for zcta in sorted(self.zctas):
+			# calculate the data from the totals for this ZCTA
+			i = self.zctas[zcta]
+
+			mean_age = -1
+			if (totals[N_AGES][i] > 0):
+				mean_age = totals[AGE_SUM][i] / float(totals[N_AGES][i])
+
+			percent_female = -1
+			if (totals[N_GENDER][i] > 0):
+				percent_female = 100. * totals[N_FEMALE][i] / totals[N_GENDER][i]
+			percent_married = -1
+			if (totals[N_MARITAL][i] > 0):
+				percent_married = 100. * totals[N_MARRIED][i] / totals[N_MARITAL][i]
+
+			out.write("%s, %d, %4.1f, %4.1f, %4.1f\n"%(zcta, totals[N_CASES][i], mean_age, percent_female, percent_married))
+
+# end of DemographicsSink
+
+###############################################################################
+# AgeGroupSink - number of patients, with an age, 65 or older and younger
+#	than 65 in each ZCTA
+###############################################################################
+
+N_AGE_KNOWN	= 1		# number of patients with an age
+N_65_PLUS	= 2		# number of patients 65 or older
+N_UNDER_65	= 3		# number of patients younger than 65
+
+class AgeGroupSink(ZctaTotals):
+
+	def __init__(self):
+		ZctaTotals.__init__(self, 4)
+
+	def Add(self, zcta, rec):
+		totals = self.totals
+		i = self.Index(zcta)
+
+		totals[N_CASES][i] += 1
+
+		if rec[4].strip() != '':
+			try:
+				age = int(rec[4])
+			except ValueError:
+				NTM_diagnostics.current.Report("bad age", rec[0], "\nError: bad age field [%s] for record [%s].\n", rec[4], rec[0])
+				return
+			totals[N_AGE_KNOWN][i] += 1
+			if (age < 65):
+				totals[N_UNDER_65][i] += 1
+			else:
+				totals[N_65_PLUS][i] += 1
+
+	def Write(self, out, cat_name, write_header):
+		totals = self.totals
+		if (write_header):
+			out.write("ZCTA, total cases, # w/ages, cases 65+, cases <65\n")
+		for zcta in sorted(self.zctas):
+			i = self.zctas[zcta]
+			out.write("%s, %d, %d, %d, %d\n"%(zcta, totals[N_CASES][i], totals[N_AGE_KNOWN][i], totals[N_65_PLUS][i], totals[N_UNDER_65][i]))
+
+# end of AgeGroupSink
+
+###############################################################################
+# PatientRowsSink - a row for each patient, with its ZCTA, state, age group
+#	and gender.  The rows are written in the order of the ZCTA, and in
+#	input order within a ZCTA.
+###############################################################################
+class PatientRowsSink(object):
+
+	def __init__(self):
+		self.zctas = {}			# ZCTA to list of patient records
+
+	def Add(self, zcta, rec):
+		if (self.zctas.has_key(zcta)):
+			self.zctas[zcta].append(rec)
+		else:
+			self.zctas[zcta] = [rec]
+
+	def Write(self, out, cat_name, write_header):
+		if (write_header):
+			out.write("patientID, ZCTA, state, #cases, agegroup, gender\n")
+		for zcta in sorted(self.zctas):
+			for rec in self.zctas[zcta]:
+				pid = rec[0].strip()
+				state = rec[8].strip()
+				age_cat = "unknown"
+				if rec[4].strip() != '':
+					try:
+						age = int(rec[4])
+					except:
+						NTM_diagnostics.current.Report("bad age", rec[0],
+							"\nError: bad age field [%s] for record [%s].\n\t[%s]\n", rec[4], rec[0], ", ".join(rec))
+						age = 0
+
+					if (age >= 65):
+						age_cat = "65+"
+					else:
+						age_cat = "<65"
+				gender = rec[5].strip()
+				out.write("%s, %s, %s, %d, %s, %s\n"%(pid, zcta, state, 1, age_cat, gender))
+
+# end of PatientRowsSink
+
+# sink class of each view
+VIEWS = {"counts": CountsSink, "data": DemographicsSink, "age": AgeGroupSink, "attr": PatientRowsSink}
+VIEW_NAMES = ["counts", "data", "age", "attr"]
+
+###############################################################################
+# NewOutput - create an output of the patients with a category
+#	selector is a 1 based category number, ANY or OTHER.
+# Returns: [name, want_any, want_other, category (0 based), sink, filename]
+#	or None if the selector is not valid
+###############################################################################
+
+def NewOutput(selector, categories, sink, filename=None):
+
+	output = ParseSelector(selector, categories)
+	if (output == None):
+		return None
+	return output + [sink, filename]
+
+# end of NewOutput()
+
+###############################################################################
+# ParseOutputSpec - parse an output specification of the form
+#	<view>:<category>=<filename>
+# Returns: the output (see NewOutput), or None if the specification is not valid
+###############################################################################
+
+def ParseOutputSpec(spec, categories, write_state=False):
+
+	if (spec.find(':') < 1) or (spec.find('=') < 1):
+		return None
+	view, rest = spec.split(':', 1)
+	selector, filename = rest.split('=', 1)
+
+	view = view.strip().lower()
+	if (not VIEWS.has_key(view)):
+		return None
+	if (view == "counts"):
+		sink = CountsSink(write_state)
+	else:
+		sink = VIEWS[view]()
+
+	if (filename == "-"):
+		filename = None
+	return NewOutput(selector, categories, sink, filename)
+
+# end of ParseOutputSpec()
+
+###############################################################################
+# AggregatePatients - categorize the records of each patient once, and add
+#	the patient to the sink of every output whose category it matches.
+#	The first record of the patient is added, in the ZCTA of the patient.
+# Returns: number of patients
+###############################################################################
+
+def AggregatePatients(patients, category_masks, outputs, lookup_zcta=Lookup_ZCTA):
+
+	metrics = NTM_metrics.current
+	n_patients = 0
+	for records in patients:
+		metrics.Switch("aggregate")
+		n_patients += 1
+		pid, zcta, patient_mask, count_other = PatientCategories(records, category_masks, lookup_zcta)
+		if (not pid):
+			continue
+
+		for name, want_any, want_other, category, sink, filename in outputs:
+			if PatientMatches(patient_mask, count_other, want_any, want_other, category):
+				sink.Add(zcta, records[0])
+
+	return n_patients
+
+# end of AggregatePatients()
+
+###############################################################################
+# WriteOutputs - write the sink of each output to its file, or to stdout
+###############################################################################
+
+def WriteOutputs(outputs, write_header):
+
+	NTM_metrics.current.Switch("write")
+	for name, want_any, want_other, category, sink, filename in outputs:
+		if (filename == None):
+			sink.Write(sys.stdout, name, write_header)
+		else:
+			with open(filename, 'w') as out:
+				sink.Write(out, name, write_header)
+
+# end of WriteOutputs()
+
+###############################################################################
+# LoadCategoryFile - load the categories and write them to stderr
+# Returns: (categories, category masks)
+###############################################################################
+
+def LoadCategoryFile(cat_filename):
+
+	categories = LoadCategories(cat_filename)
+	# print the categories
+	for i, entries in enumerate(categories):
+		sys.stderr.write("%5d %s:"%(i+1,entries[0]))
+		for i,e in enumerate(entries[1:]):
+			if (i%8 == 0):
+				sys.stderr.write("\n\t")
+			sys.stderr.write(" %s"%e)
+		sys.stderr.write("\n")
+
+	return (categories, CategoryMasks(categories))
+
+# end of LoadCategoryFile()
+
+###############################################################################
+#
+# Main application processing
+#
+###############################################################################
+
+def Main():
+
+	NTM_metrics.StartMetrics()
+
+	cat_filename = "SPECIES_CATEGORIES.TXT"
+	write_header = False
+	write_state = False
+	output_specs = []
+
+	filename_ZTAC = "zipcodezctatable.txt"
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "C:hsw:Z:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-Z':			filename_ZTAC = value
+		elif opt == '-C':			cat_filename = value
+		elif opt == '-h':			write_header = True
+		elif opt == '-s':			write_state = True
+		elif opt == '-w':			output_specs.append(value)
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	if (len(args) < 1) or (len(output_specs) == 0):
+		Usage()
+		exit(-1)
+
+	categories, category_masks = LoadCategoryFile(cat_filename)
+
+	outputs = []
+	for spec in output_specs:
+		output = ParseOutputSpec(spec, categories, write_state)
+		if (output == None):
+			sys.stderr.write("\nError: invalid output [%s]. Must be <view>:<category>=<filename>, view must be %s, category value must be ANY, OTHER or in range (1 .. %d)\n"%(spec, ", ".join(VIEW_NAMES), len(categories)))
+			Usage()
+			exit(-1)
+		outputs.append(output)
+		sys.stderr.write("Collecting [%s] for patients in each ZCTA with [%s] diagnosis\n"%(spec.split(':', 1)[0], output[0]))
+
+	LoadZCTA(filename_ZTAC)
+
+	# open a filename given on the command line.
+	reader = OpenRecords(args[0])
+
+	n_patients = AggregatePatients(reader.Patients(), category_masks, outputs)
+
+	WriteOutputs(outputs, write_header)
+
+	sys.stderr.write("# Patients: %d\n"%n_patients)
+	for output in outputs:
+		sys.stderr.write("# ZCTA:     %d\t[%s] %s\n"%(len(output[4].zctas), output[0], output[5] or "stdout"))
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
+
+	Main()
+
+###############################################################################
+###############################################################################
@@ -0,0 +1,182 @@
+# Benchmark of the stages of the NTM data analysis pipe line
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	For each size, a synthetic data set is written (see NTM_synthetic_data.py)
+#	and each stage of the pipe line (see NTM_pipeline.py) is run on it, one
+#	at a time.  The elapsed time, the number of lines read, the lines per
+#	second and the peak resident memory of each stage are written as CSV.
+#
+#	The data sets are kept in the work directory and reused by later runs
+#	with the same size and seed, so only the stages are timed again.
+#
+#	Usage: python NTM_benchmark.py [options] [work_dir] > benchmark.csv
+#
+
+import string
+import sys, re, os, getopt
+import subprocess, time
+from NTM_pipeline import INPUT_FILE, CF_PATIENT_IDS, DatasetStages, OrderStages
+from NTM_synthetic_data import ParseCount, WriteDataSet
+
+COUNT_BLOCK_SIZE = 1024 * 1024
+RESULTS_DIR = "Results"
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] [work_dir] \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t Times the stages of the pipe line on synthetic data sets, and writes the results as CSV.\n')
+	sys.stderr.write( '\t      -n <sizes>   comma separated list of the number of lab records [default: 10K]\n')
+	sys.stderr.write( '\t                   (e.g. 10K,1M,10M)\n')
+	sys.stderr.write( '\t      -r <seed>    seed of the synthetic data [default: 0]\n')
+	sys.stderr.write( '\t      -s <states>  comma separated list of states to create data sets for [default: CO]\n')
+	sys.stderr.write( '\t      -t <stages>  comma separated list of the names of the stages to time [default: all]\n')
+	sys.stderr.write( '\t      -g   write the synthetic data sets again, even if they exist\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# CountLines - number of lines in a file, or 0 if it does not exist
+###############################################################################
+
+def CountLines(filename):
+
+	if (not os.path.exists(filename)):
+		return 0
+
+	n_lines = 0
+	with open(filename, 'rb') as infile:
+		while True:
+			block = infile.read(COUNT_BLOCK_SIZE)
+			if (not block):
+				break
+			n_lines += block.count("\n")
+	return n_lines
+
+# end of CountLines()
+
+###############################################################################
+# TimeStage - run the command of a stage in the directory of the data set.
+#	The stderr of the command is written to <stage name>.log in the
+#	results directory.
+# Returns: (status, elapsed seconds, peak resident memory in KB)
+###############################################################################
+
+def TimeStage(stage, data_dir):
+
+	args = [sys.executable, stage.Script()] + stage.command[1:]
+	log_filename = os.path.join(data_dir, RESULTS_DIR, stage.name + ".log")
+
+	start = time.time()
+	with open(log_filename, 'w') as errfile:
+		if (stage.stdout):
+			with open(os.path.join(data_dir, stage.stdout), 'w') as outfile:
+				process = subprocess.Popen(args, cwd=data_dir, stdout=outfile, stderr=errfile)
+		else:
+			process = subprocess.Popen(args, cwd=data_dir, stderr=errfile)
+
+		# wait4 gives the resource usage of the stage process
+		pid, status, usage = os.wait4(process.pid, 0)
+	elapsed = time.time() - start
+
+	if os.WIFSIGNALED(status):
+		status = -os.WTERMSIG(status)
+	else:
+		status = os.WEXITSTATUS(status)
+
+	return (status, elapsed, usage.ru_maxrss)
+
+# end of TimeStage()
+
+###############################################################################
+# BenchmarkSize - time the stages on a data set of n_records records
+#	Writes a line of results for each stage to outfile.
+# Returns: True if all the stages succeeded
+###############################################################################
+
+def BenchmarkSize(outfile, work_dir, n_records, seed, states, stage_names, regenerate):
+
+	data_dir = os.path.join(work_dir, "%d_%d"%(n_records, seed))
+	if (regenerate) or (not os.path.exists(os.path.join(data_dir, INPUT_FILE))):
+		start = time.time()
+		WriteDataSet(data_dir, n_records, seed)
+		sys.stderr.write("Wrote the data set in %.1f seconds\n"%(time.time() - start))
+	if (not os.path.isdir(os.path.join(data_dir, RESULTS_DIR))):
+		os.makedirs(os.path.join(data_dir, RESULTS_DIR))
+
+	ok = True
+	for stage in OrderStages(DatasetStages(RESULTS_DIR, INPUT_FILE, CF_PATIENT_IDS, states)):
+		if (stage_names) and (stage.name not in stage_names):
+			continue
+
+		# the lines of the records read by the stage
+		n_lines = CountLines(os.path.join(data_dir, stage.inputs[0]))
+
+		sys.stderr.write("### [%d] %s\n"%(n_records, stage.CommandLine()))
+		status, elapsed, max_rss = TimeStage(stage, data_dir)
+		if (status != 0):
+			sys.stderr.write("### [%s] failed (status %d), see [%s.log]\n"%(stage.name, status, os.path.join(data_dir, RESULTS_DIR, stage.name)))
+			ok = False
+
+		outfile.write("%d,%s,%.3f,%d,%.0f,%d,%d\n"%(n_records, stage.name, elapsed, n_lines,
+			n_lines / max(elapsed, 0.001), max_rss, status))
+		outfile.flush()
+
+	return ok
+
+# end of BenchmarkSize()
+
+###############################################################################
+#
+# Main application processing
+#
+###############################################################################
+
+def Main():
+
+	sizes = [10000]
+	seed = 0
+	states = ["CO"]
+	stage_names = None
+	regenerate = False
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "gn:r:s:t:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-n':			sizes = [ParseCount(n) for n in value.split(',')]
+		elif opt == '-r':			seed = int(value)
+		elif opt == '-s':			states = [s.strip().upper() for s in value.split(',')]
+		elif opt == '-t':			stage_names = set([s.strip() for s in value.split(',')])
+		elif opt == '-g':			regenerate = True
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	work_dir = "Benchmark"
+	if (len(args) > 0):
+		work_dir = args[0]
+
+	sys.stdout.write("records,stage,seconds,input_lines,lines_per_second,max_rss_kb,status\n")
+
+	ok = True
+	for n_records in sizes:
+		if not BenchmarkSize(sys.stdout, work_dir, n_records, seed, states, stage_names, regenerate):
+			ok = False
+
+	if (not ok):
+		exit(-1)
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	Main()
+
+###############################################################################
+###############################################################################
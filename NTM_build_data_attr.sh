@@ -38,34 +38,21 @@ echo "Creating copy of this script in output directory [$OUT_DIR/script_for_attr
 Run_Command cp NTM_build_data_attr.sh $OUT_DIR/script_for_attrs.sh
 
 echo " " >&2
-echo "Generate the case counts, using file: $SOURCE" >&2
-
-echo " " >&2
-echo "Generate the case counts for species in any category (RAPID or SLOW) for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_any_data.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data.py -a -h -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_any_data.csv"
-
-echo " " >&2
-echo "Generate the case counts for species in category RAPID for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_rapid_data.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data.py -h -c 1 -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_rapid_data.csv"
-
-echo " " >&2
-echo "Generate the case counts for species in category RAPID for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_slow_data.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data.py -h -c 2 -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_slow_data.csv"
-
-
-
-echo " " >&2
-echo "Generate the case attributes, using file: $SOURCE" >&2
-
-echo " " >&2
-echo "Generate the case attributes for species in any category (RAPID or SLOW) for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_any_attr.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data3.py -a -h -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_any_attr.csv"
-
-echo " " >&2
-echo "Generate the case attributes for species in category RAPID for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_rapid_attr.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data3.py -h -c 1 -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_rapid_attr.csv"
-
-echo " " >&2
-echo "Generate the case attributes for species in category RAPID for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_slow_attr.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_data3.py -h -c 2 -s RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_slow_attr.csv"
-
+echo "Generate the case counts and attributes, using file: $SOURCE" >&2
+
+# The data (counts, mean age, % female, % married) and the attributes (a row for
+# each patient) of each category are collected in a single pass of $SOURCE.
+for CATEGORY in any rapid slow
+do
+	echo "Generate the case counts for species in category $CATEGORY for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_"$CATEGORY"_data.csv" >&2
+	echo "Generate the case attributes for species in category $CATEGORY for each ZCTA [$SOURCE] ==> "$OUT_DIR/$LABEL"_"$CATEGORY"_attr.csv" >&2
+done
+
+Run_Command $PYTHON NTM_ZCTA_category_aggregate.py -h -C RAPID_SLOW_CATEGORIES.txt \
+	-w data:ANY=$OUT_DIR/$LABEL"_any_data.csv" \
+	-w data:1=$OUT_DIR/$LABEL"_rapid_data.csv" \
+	-w data:2=$OUT_DIR/$LABEL"_slow_data.csv" \
+	-w attr:ANY=$OUT_DIR/$LABEL"_any_attr.csv" \
+	-w attr:1=$OUT_DIR/$LABEL"_rapid_attr.csv" \
+	-w attr:2=$OUT_DIR/$LABEL"_slow_attr.csv" \
+	$SOURCE
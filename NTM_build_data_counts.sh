@@ -52,41 +52,38 @@ Run_Command cp NTM_build_data_counts.sh $OUT_DIR/script_for_counts.sh
 #
 
 # Using RAPID_SLOW_CATEGORIES.txt
+#	All the counts for a categories file are created in a single pass of the source data.
+#	Each output is given as: -w <category>=<filename>  (category is ANY, OTHER or a 1 based number)
+#
 echo " " >&2
 echo "Creating ZCTA counts for category ANY in RAPID_SLOW_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_ANY_RAPID_SLOW.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -a -C RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_ANY_RAPID_SLOW.csv"
-
-echo " " >&2
 echo "Creating ZCTA counts for category OTHER in RAPID_SLOW_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_OTHER_THAN_RAPID_SLOW.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -o -C RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_OTHER_THAN_RAPID_SLOW.csv"
-
-echo " " >&2
 echo "Creating ZCTA counts for category 1 in RAPID_SLOW_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_RAPID.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -c 1 -C RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_RAPID.csv"
-
-echo " " >&2
 echo "Creating ZCTA counts for category 2 in RAPID_SLOW_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_SLOW.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -c 2 -C RAPID_SLOW_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_SLOW.csv"
+Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -C RAPID_SLOW_CATEGORIES.txt \
+	-w ANY=$OUT_DIR/$LABEL"_ANY_RAPID_SLOW.csv" \
+	-w OTHER=$OUT_DIR/$LABEL"_OTHER_THAN_RAPID_SLOW.csv" \
+	-w 1=$OUT_DIR/$LABEL"_RAPID.csv" \
+	-w 2=$OUT_DIR/$LABEL"_SLOW.csv" \
+	$SOURCE
 
 #
 # Using INDIVIDUAL_CATEGORIES.txt
 #
 echo " " >&2
 echo "Creating ZCTA counts for category ANY in INDIVIDUAL_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_ANY_INDIVIDUAL.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -a -C INDIVIDUAL_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_ANY_INDIVIDUAL.csv"
-
-echo " " >&2
 echo "Creating ZCTA counts for category OTHER in INDIVIDUAL_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_OTHER_THAN_INDIVIDUAL.csv" >&2
-Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -o -C INDIVIDUAL_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_OTHER_THAN_INDIVIDUAL.csv"
+INDIVIDUAL_OUTPUTS="-w ANY="$OUT_DIR/$LABEL"_ANY_INDIVIDUAL.csv -w OTHER="$OUT_DIR/$LABEL"_OTHER_THAN_INDIVIDUAL.csv"
 
 #
-# Loop thru the SPECIES to generate individual count files
+# Loop thru the SPECIES to add the individual count files
 #
 SPECIES_ID=1
 for SPECIES in ABSCESSUS AVIUM AVIUM_COMPLEX INTRACELLULARE CHIMAERA CHELONAE FORTUITUM SIMIAE GORDONAE KANSASII MASSILIENSE MUCOGENICUM PEREGRINUM 
 	do
-	echo " " >&2
 	echo "Creating ZCTA counts for category $SPECIES_ID in INDIVIDUAL_CATEGORIES.txt ==> "$OUT_DIR/$LABEL"_"$SPECIES".csv" >&2
-	Run_Command Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -c $SPECIES_ID -C INDIVIDUAL_CATEGORIES.txt $SOURCE > $OUT_DIR/$LABEL"_"$SPECIES.csv
-	echo "Created individual species file of counts for:" $((SPECIES_ID++)) $SPECIES "==> "$OUT_DIR/$LABEL"_"$SPECIES".csv" >&2
+	INDIVIDUAL_OUTPUTS=$INDIVIDUAL_OUTPUTS" -w "$((SPECIES_ID++))"="$OUT_DIR/$LABEL"_"$SPECIES".csv"
 	done
+
+Run_Command $PYTHON NTM_ZCTA_category_counts.py $OPTIONS -C INDIVIDUAL_CATEGORIES.txt $INDIVIDUAL_OUTPUTS $SOURCE
+
@@ -2,6 +2,9 @@
 # Run this script from the command line, capture the stderr output into a file
 #		./NTM_build_datasets.sh  [results_dir] 2> build.txt
 #
+#	NTM_pipeline.py runs the same stages, skipping the stages that are up to date:
+#		python NTM_pipeline.py [-s CO,FL] [results_dir] 2> build.txt
+#
 #	The data analysis pipe line:
 #		1. 	Using manually fixed (spelling) data, 
 #			summarize the data (types of species and methods cited, number of patients, ...)
@@ -41,15 +44,27 @@ OUT_DIR=$1
 
 INPUT_FILE=NTM_wfixes.csv
 CF_PATIENT_IDS=NTM_CF_patient_ids.csv
-CF_PATIENTS=NTM_CF_patients.csv
-NON_CF_PATIENTS=NTM_Non_CF_patients.csv
+# The record files passed between the scripts are compressed when COMPRESS_EXT
+# is set to .gz, .bz2, .xz or .zst (e.g. COMPRESS_EXT=.gz ./NTM_build_datasets.sh)
+: ${COMPRESS_EXT:=""}
+
+CF_PATIENTS=NTM_CF_patients.csv$COMPRESS_EXT
+NON_CF_PATIENTS=NTM_Non_CF_patients.csv$COMPRESS_EXT
 SUMMARY=summary.txt
-UNDIAGNOSED=multi_per_patient_undiagnosed.csv
-DIAGNOSED=multi_per_patient_diagnosed.csv
-COLO_DIAGNOSED=CO_only_per_patient.csv
-FL_DIAGNOSED=FL_only_per_patient.csv
+UNDIAGNOSED=multi_per_patient_undiagnosed.csv$COMPRESS_EXT
+DIAGNOSED=multi_per_patient_diagnosed.csv$COMPRESS_EXT
+COLO_DIAGNOSED=CO_only_per_patient.csv$COMPRESS_EXT
+FL_DIAGNOSED=FL_only_per_patient.csv$COMPRESS_EXT
+STATE_DIAGNOSED=%s_only_per_patient.csv$COMPRESS_EXT
 PATIENT_SPECIES=species_freq.csv
 
+# Each script writes the metrics of its run (time, memory, rows read) to a
+# directory of this build, under this directory, so the report of the metrics
+# has only the runs of this build
+: ${NTM_METRICS_DIR:="$OUT_DIR/metrics"}
+NTM_METRICS_DIR=$NTM_METRICS_DIR/build_$(date +%Y%m%d_%H%M%S)
+export NTM_METRICS_DIR
+
 # Function that prints the command line to stderr and performs the command
 # This is used to record the parameters being used in the output of the script
 function Run_Command() { CMD=$* ; echo '###' $CMD >&2 ; echo " " >&2; $CMD ; }
@@ -65,8 +80,7 @@ Run_Command cp NTM_build_datasets.sh $OUT_DIR/script_for_datasets.sh
 
 # split the source data into CF and NON-CF patients
 echo "Splitting the input file [$INPUT] into CF and NON-Cf patient records ==> $OUT_DIR/$NON_CF_PATIENTS and $OUT_DIR/$CF_PATIENTS" >&2
-Run_Command python NTM_Split_CF_patients.py  -r -c NTM_CF_patient_ids.csv $INPUT_FILE > $OUT_DIR/$NON_CF_PATIENTS
-Run_Command python NTM_Split_CF_patients.py  -m -c NTM_CF_patient_ids.csv $INPUT_FILE > $OUT_DIR/$CF_PATIENTS
+Run_Command python NTM_Split_CF_patients.py  -c NTM_CF_patient_ids.csv -R $OUT_DIR/$NON_CF_PATIENTS -M $OUT_DIR/$CF_PATIENTS $INPUT_FILE
 
 # Extract diagnosis and method from patient records and write summary
 echo " " >&2
@@ -81,23 +95,26 @@ Run_Command python NTM_species_summary.py -s -m $OUT_DIR/$CF_PATIENTS > $OUT_DIR
 # Extract diagnosis and method from patient records
 echo " " >&2
 echo "Creating list of species found for each patient [$OUT_DIR/$NON_CF_PATIENTS] ==> $OUT_DIR/$DIAGNOSED" >&2
-Run_Command python NTM_species_per_patient.py -r $OUT_DIR/$NON_CF_PATIENTS > $OUT_DIR/$DIAGNOSED
+Run_Command python NTM_species_per_patient.py -r -O $OUT_DIR/$DIAGNOSED $OUT_DIR/$NON_CF_PATIENTS
 
 # Extract undiagnosed patients
 echo " " >&2
 echo "Creating list of both diagnosed and undiagnosed patients [$OUT_DIR/$NON_CF_PATIENTS] ==> $OUT_DIR/$UNDIAGNOSED" >&2
-Run_Command python NTM_species_per_patient.py -r -u $OUT_DIR/$NON_CF_PATIENTS > $OUT_DIR/$UNDIAGNOSED
+Run_Command python NTM_species_per_patient.py -r -u -O $OUT_DIR/$UNDIAGNOSED $OUT_DIR/$NON_CF_PATIENTS
 
-# Extract CO diagnosed patients
+# Extract CO and FL diagnosed patients
+#	the output files are named by STATE_DIAGNOSED, with %s replaced by the state
 echo " " >&2
-echo "Creating list of both Colorado only diagnosed  [$OUT_DIR/$NON_CF_PATIENTS] ==> $OUT_DIR/$COLO_DIAGNOSED" >&2
-Run_Command python NTM_state_filter.py -s CO $OUT_DIR/$DIAGNOSED > $OUT_DIR/$COLO_DIAGNOSED
+echo "Creating lists of Colorado only and Florida only diagnosed  [$OUT_DIR/$NON_CF_PATIENTS] ==> $OUT_DIR/$COLO_DIAGNOSED and $OUT_DIR/$FL_DIAGNOSED" >&2
+Run_Command python NTM_state_filter.py -s CO,FL -o $OUT_DIR/$STATE_DIAGNOSED $OUT_DIR/$DIAGNOSED
 
-# Extract FL diagnosed patients
-echo " " >&2
-echo "Creating list of both Florida only diagnosed  [$OUT_DIR/$NON_CF_PATIENTS] ==> $OUT_DIR/$FL_DIAGNOSED" >&2
-Run_Command python NTM_state_filter.py -s FL $OUT_DIR/$DIAGNOSED > $OUT_DIR/$FL_DIAGNOSED
 
+#
+# Compile the index of the ZIP to ZCTA table once, it is memory mapped by the ZCTA scripts
+#
+echo " " >&2
+echo "Compiling the index of the ZIP to ZCTA table [zipcodezctatable.txt] ==> zipcodezctatable.txt.idx" >&2
+Run_Command python NTM_zcta.py -Z zipcodezctatable.txt
 
 #
 # Count the number of patients in each ZCTA with given diagnosis 
@@ -123,15 +140,15 @@ echo "Creating data count files (prefix: NonCF_FL) for $FL_DIAGNOSED" >&2
 #
 echo " " >&2
 echo "Creating combined list of species diagnosed for each patient ==> $OUT_DIR/NonCF_ALL_$PATIENT_SPECIES" >&2
-Run_Command python NTM_combined_patient_species.py -h $OUT_DIR/$DIAGNOSED > $OUT_DIR/NonCF_ALL_$PATIENT_SPECIES
+Run_Command python NTM_combined_patient_species.py -1 -h $OUT_DIR/$DIAGNOSED > $OUT_DIR/NonCF_ALL_$PATIENT_SPECIES
 
 echo " " >&2
 echo "Creating combined list of species diagnosed for each CO patient ==> $OUT_DIR/NonCF_CO_PATIENT_SPECIES" >&2
-Run_Command python NTM_combined_patient_species.py -h $OUT_DIR/$COLO_DIAGNOSED > $OUT_DIR/NonCF_CO_$PATIENT_SPECIES
+Run_Command python NTM_combined_patient_species.py -1 -h $OUT_DIR/$COLO_DIAGNOSED > $OUT_DIR/NonCF_CO_$PATIENT_SPECIES
 
 echo " " >&2
 echo "Creating combined list of species diagnosed for each FL patient ==> $OUT_DIR/NonCF_FL_PATIENT_SPECIES" >&2
-Run_Command python NTM_combined_patient_species.py -h $OUT_DIR/$FL_DIAGNOSED > $OUT_DIR/NonCF_FL_$PATIENT_SPECIES
+Run_Command python NTM_combined_patient_species.py -1 -h $OUT_DIR/$FL_DIAGNOSED > $OUT_DIR/NonCF_FL_$PATIENT_SPECIES
 
 #
 # Generate the attribute files for DIAGNOSED and COLO_DIAGNOSED
@@ -147,3 +164,7 @@ echo "Creating data attribute files (prefix: NonCF_CO) for $COLO_DIAGNOSED" >&2
 echo " " >&2
 echo "Creating data attribute files (prefix: NonCF_FL) for $FL_DIAGNOSED" >&2
 /bin/bash ./NTM_build_data_attr.sh $OUT_DIR NonCF_FL $OUT_DIR/$FL_DIAGNOSED >&2
+
+echo " " >&2
+echo "Creating report of the metrics of the runs [$NTM_METRICS_DIR] ==> $OUT_DIR/metrics_report.txt" >&2
+Run_Command python NTM_metrics.py -j $OUT_DIR/metrics_report.json $NTM_METRICS_DIR > $OUT_DIR/metrics_report.txt
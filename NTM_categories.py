@@ -0,0 +1,196 @@
+# Categories of species used to count NTM patients
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+
+import string
+import sys, os, re
+import NTM_diagnostics
+
+###############################################################################
+
+def LoadCategories(filename):
+
+	# Species Category file format is:
+	# 	[cat1_name]
+	# 	species1_name
+	# 	species2_name
+	# 	species3_name
+	# 	...
+	#
+	# 	[cat2_name]
+	# 	species1_name
+	# 	...
+	#
+	# 	...
+	#
+	# Returns:
+	#	categories is a list of [name, species, ...]
+	#
+	categories = []
+
+	key = ""
+	entries = []
+
+	with open(filename, 'r') as catfile:
+		for line in catfile:
+			line = line.strip()
+			if (len(line) == 0):  # is an empty line
+				continue
+			if (line[0] == '#'):  # is a comment line
+				continue
+
+			if (line[0] == '[') and (line[-1] == ']'):
+				# append current entries to categories
+				if (len(entries) > 0):
+					categories.append(entries)
+				key = line[1:-1]
+				entries = [key]
+			else:
+				entries.append(line)
+
+	# append final entries to categories
+	if (len(entries) > 0):
+		categories.append(entries)
+
+	return categories
+
+# end of ReadCategories
+
+###############################################################################
+# CategoryMasks - create the index of species to categories
+#
+#	Bit i of the mask for a species is set if the species is in category i
+#	(0 based).  Each entry of a category is indexed, including its name.
+#	Species that are not in any category are not in the index.
+#
+# Returns: dict of species to category bit mask
+###############################################################################
+
+def CategoryMasks(categories):
+
+	masks = {}
+	for i, entries in enumerate(categories):
+		for species in entries:
+			masks[species] = masks.get(species, 0) | (1 << i)
+
+	return masks
+
+# end of CategoryMasks()
+
+###############################################################################
+# PatientCategories - categorize the records given for a patient.
+#	Find the categories of the species in the records, using the mask of
+#	each species from CategoryMasks, and count the number of records with a
+#	species that is not in any category.  The ZCTA of the patient is found
+#	by lookup_zcta(zip).
+# Returns: (patient id, ZCTA, mask of categories found, count of other species)
+#	where bit i of the mask is set if a species in category i was found
+#	or (None, None, None, None) if the patient has no known ZCTA
+###############################################################################
+
+def PatientCategories(records, category_masks, lookup_zcta):
+
+	if len(records) == 0:
+		return (None, None, None, None)
+		
+#	print "\n\tRecords:", len(records), records
+	
+	patient_id = records[0][0]
+	zcta = lookup_zcta(records[0][9].strip())
+	if (zcta == ""):
+		NTM_diagnostics.current.Report("patient with empty ZCTA", patient_id,
+			"empty ZCTA for ZIP: (%s) [\t%s]\n", records[0][9].strip(), "\t".join(records[0]))
+	if (zcta == None) or (zcta == ""):
+		return (None, None, None, None)
+		
+	patient_mask = 0
+	count_other = 0
+
+	for rec in records:
+		species = rec[2].strip()
+		
+		# look up the categories of the given species.
+		# if not found in any category, add it to other species count.
+		mask = category_masks.get(species, 0)
+		if (mask == 0):
+		#	sys.stderr.write("Other:[%s] %s\n"%(species,rec[0]))
+			count_other += 1				
+		else:
+			patient_mask |= mask
+
+	# Columns of the input:
+	#	0	ASID
+	#	1	Date of diagnosis
+	#	2	Species diagnosed 
+	#	3	Method of diagnosis 
+	#	4	Current Age
+	#	5	Gender of Subject
+	#	6	Ethnicity of subject
+	#	7	City 
+	#	8	State 
+	#	9	ZIP
+	#	10	Marital Status 
+
+	zcta = lookup_zcta(rec[9].strip())
+
+	return (patient_id, zcta, patient_mask, count_other)
+	
+# end of PatientCategories()
+
+###############################################################################
+# PatientMatches - check the categories found for a patient against the
+#	selection criteria.
+# Returns: True if the patient should be counted.
+###############################################################################
+
+def PatientMatches(patient_mask, count_other, want_any, want_other, category):
+
+	matches = False
+	
+	if (want_any):
+		# check to see if any category or other species was found	
+		if (patient_mask != 0) or (count_other > 0):
+			matches = True
+	elif (want_other and (count_other > 0)):
+			matches = True
+	else:
+		# looking for values in specific category 
+#		if (want_rapid or want_slow or want_other):
+#			matches = True		#assume it matches, unless missing a wanted value
+#		if (want_rapid and (counts[0] == 0)):
+#			matches = False
+#		if (want_slow and (counts[1] == 0)):
+#			matches = False
+		if (patient_mask & (1 << category)):
+			matches = True
+
+	return matches
+
+# end of PatientMatches()
+
+###############################################################################
+# ParseSelector - parse the selection criteria of a category, given as a
+#	1 based category number, ANY or OTHER.
+# Returns: [name, want_any, want_other, category (0 based)] or None if the
+#	selector is not valid
+###############################################################################
+
+def ParseSelector(selector, categories):
+
+	selector = selector.strip().upper()
+
+	if (selector == "ANY"):
+		return ["ANY", True, False, 0]
+	if (selector == "OTHER"):
+		return ["OTHER", False, True, 0]
+	if (not selector.isdigit()):
+		return None
+
+	cat = int(selector)
+	if (cat < 1) or (cat > len(categories)):
+		return None
+	return [categories[cat-1][0], False, False, cat-1]
+
+# end of ParseSelector()
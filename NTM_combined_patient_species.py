@@ -8,6 +8,11 @@
 import string
 import sys, re, os, getopt
 import operator
+from NTM_read_data import OpenRecords, BufferedStdout
+from NTM_zcta import LoadZCTA, Lookup_ZCTA, Lookup_ZCTA_State
+from NTM_npy import WriteNpy
+from NTM_metrics import StartMetrics
+import NTM_diagnostics
 
 ###############################################################################
 
@@ -30,73 +35,45 @@ def Usage():
 	sys.stderr.write( 'Usage: %s [options] <source data> \n'%(re.sub('^.*/','',sys.argv[0])) )
 	sys.stderr.write( '\t This application combines the individual species data for each patient into a single entry.\n' )
 	sys.stderr.write( '\t   -h  write header to output\n' )
+	sys.stderr.write( '\t   -1  read the source data once, keeping the species of each patient until the end\n' )
+	sys.stderr.write( '\t   -b <basename>  write the species of each patient as a packed bit matrix instead of CSV (implies -1):\n' )
+	sys.stderr.write( '\t         <basename>.npy           patients x species bits, packed 8 species per byte\n' )
+	sys.stderr.write( '\t         <basename>_patients.csv  combined record of each patient, without the species columns\n' )
+	sys.stderr.write( '\t         <basename>_species.txt   name of each species column\n' )
 	sys.stderr.write( '\n\n' )
 # end of Usage()
 
 
 ###############################################################################
-# LoadZCTA - create mapping from zip to ZCTA value
-#		Creates a global variable to hold the data for mapping
-#		a zip code into ZCTA code
-#		Data is parsed from the file whose name is given as a parameter
+# 	Combine the attributes of the records given for a patient into a single
+#	record, without the species columns.
 ###############################################################################
 
-def LoadZCTA(fipstozcta_file):
+def PatientAttributes(records):
 
-	global zip_to_zcta
-	
-	zip_to_zcta = {}
+#	print "\n\tRecords:", len(records), records
 	
-	with open(fipstozcta_file, 'r') as infile:
-		header = infile.readline()
-		for line in infile.readlines():
-			fields = line.split('\t')
-			zip = fields[0].strip()
-			zcta = fields[4].strip()
-			zip_to_zcta[zip] = zcta
-
-	return
-
-# end of LoadZCTA()
-
-###############################################################################
-# Lookup_ZCTA - Find the ZCTA value for the given zip code
-#
-#	Uses the global mapping data structure created in LoadZCTA.
-#	Strips zip down to 5 digit code.
-#	Looks up the 5 digit code in the mapping data structure.
-#	Makes sure the result is a 5 digit string with leading 0's
-###############################################################################
-def Lookup_ZCTA(zip_str):
-
-	global zip_to_zcta
-
-	zip_whole = zip_str.strip()
-	z = zip_whole.split("-")[0]
-	#print zip_whole + '\t' + zip
+	patient_id = records[0][0]
 
-	# pad out the zip to 5 digits with leading 0's
-	if z.isdigit():
-		while (len(z) < 5):
-			z = "0"+z
+	# lookup ZCTA number
+	zipcode = records[0][9].strip()
+	zcta = Lookup_ZCTA(zipcode)
+	if (not zcta) or (zcta == ""):
+		NTM_diagnostics.current.Report("patient without ZCTA", patient_id,
+			"empty ZCTA for ZIP: (%s) [pid=%s]\n", zipcode, patient_id)
+		zcta = ""
+#	if (zipcode != zcta):
+#		sys.stderr.write("ZCTA [%s] from ZIP[%s]\n"%(zcta,zipcode))
+		
+	# the new combined record, from the last record of the patient
+	# remove selected fields of the record
+		#	1	Date of diagnosis
+		#	2	Species diagnosed 
+		#	3	Method of diagnosis 
+	rec = records[-1]
+	return [rec[0],rec[4],rec[5],rec[6],rec[7],rec[8],zipcode,zcta,rec[10]]
 	
-	if z in zip_to_zcta:
-		zcta = zip_to_zcta[z]
-		if (zcta == ""):
-			sys.stderr.write("empty ZCTA for ZIP: (%s)\n"%(z))
-	else:
-		return None
-#		sys.stderr.write("Using unknown ZIP: (%s)\n"%(z))
-#		zcta = z
-
-	# pad out the code to 5 digits with leading 0's
-	if zcta.isdigit():
-		while (len(zcta) < 5):
-			zcta = "0"+zcta
-
-	return zcta
-
-# end of Lookup_ZCTA()
+#end of PatientAttributes
 
 ###############################################################################
 # 	Process the records given, counting the number of species diagnosed for 
@@ -112,36 +89,12 @@ def ProcessRecords(records, species, sorted_species_list):
 	for s in species:	
 		species[s] = 0
 		
-#	print "\n\tRecords:", len(records), records
-	
-	patient_id = records[0][0]
+	new_rec = PatientAttributes(records)
 
-	# lookup ZCTA number
-	zipcode = records[0][9].strip()
-	zcta = Lookup_ZCTA(zipcode)
-	if (not zcta) or (zcta == ""):
-		sys.stderr.write("empty ZCTA for ZIP: (%s) ["%(zipcode))
-		sys.stderr.write("pid=%s"%(patient_id))
-	#	for r in records[0]:
-	#		sys.stderr.write("\t%s"%(r))
-		sys.stderr.write("]\n")
-		zcta = ""
-#	if (zipcode != zcta):
-#		sys.stderr.write("ZCTA [%s] from ZIP[%s]\n"%(zcta,zipcode))
-		
 	for rec in records:
 		diagnosis = rec[2].strip()
 		species[diagnosis] += 1		# count occurrences
 		
-	# write the new combined record
-	# remove selected fields of the record
-		#	1	Date of diagnosis
-		#	2	Species diagnosed 
-		#	3	Method of diagnosis 
-	new_rec = [rec[0],rec[4],rec[5],rec[6],rec[7],rec[8],zipcode,zcta,rec[10]]
-	
-	# ??? add ZCTA value ???
-	
 	# add the species markers for species seen
 	for s,c in sorted_species_list:
 		value = '0'
@@ -170,6 +123,69 @@ def CollectSpecies(rec, species):
 		
 #end of CollectSpecies
 
+###############################################################################
+# 	Process the records given for a patient in a single pass of the data.
+#	Collects the species into the dictionary and codes each new species with
+#	the next integer.  Returns (combined record, tuple of species codes).
+###############################################################################
+
+def CollectPatient(records, species, species_codes):
+
+	codes = set()
+	for rec in records:
+		CollectSpecies(rec, species)
+		diagnosis = rec[2].strip()
+		if not species_codes.has_key(diagnosis):
+			species_codes[diagnosis] = len(species_codes)
+		codes.add(species_codes[diagnosis])
+
+	return (PatientAttributes(records), tuple(codes))
+
+#end of CollectPatient
+
+###############################################################################
+# 	Pack the species codes of each patient into rows of a bit matrix.
+#	Species column j is bit (7 - j%8) of byte j/8 of the row, the bit order
+#	of numpy.unpackbits().
+###############################################################################
+
+def PackedRows(patients, column):
+
+	n_bytes = (len(column) + 7) / 8
+	for new_rec, codes in patients:
+		row = bytearray(n_bytes)
+		for code in codes:
+			j = column[code]
+			row[j/8] |= 0x80 >> (j%8)
+		yield str(row)
+
+#end of PackedRows
+
+###############################################################################
+# 	Write the bit matrix of species for each patient, and the sidecar files
+#	with the patient attributes and the species column names.
+#
+#	The matrix can be loaded with:
+#		bits = numpy.load("<basename>.npy", mmap_mode='r')
+#		species = numpy.unpackbits(bits, axis=1)[:, :n_species]
+###############################################################################
+
+def WriteBitMatrix(basename, attribute_names, species_names, patients, column):
+
+	n_bytes = (len(column) + 7) / 8
+	WriteNpy(basename + ".npy", '|u1', (len(patients), n_bytes), PackedRows(patients, column))
+
+	with open(basename + "_patients.csv", 'w') as outfile:
+		outfile.write(",".join(attribute_names) + "\n")
+		for new_rec, codes in patients:
+			outfile.write(",".join(new_rec) + "\n")
+
+	with open(basename + "_species.txt", 'w') as outfile:
+		for s in species_names:
+			outfile.write(s + "\n")
+
+#end of WriteBitMatrix
+
 
 ###############################################################################
 #
@@ -179,13 +195,17 @@ def CollectSpecies(rec, species):
 
 def Main():
 	
+	metrics = StartMetrics()
+
 	output_col = -1
 	write_header = False
+	single_pass = False
+	bit_basename = None
 
 	filename_ZTAC = "zipcodezctatable.txt"
 	
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "hz:", ["help"])
+		opts, args = getopt.getopt(sys.argv[1:], "1b:hz:", ["help"])
 	except getopt.GetoptError:
 		Usage()
 		sys.exit(1)
@@ -194,6 +214,8 @@ def Main():
 		#print opt, value
 		if	 opt == '-z':			filename_ZTAC = value
 		elif opt == '-h':			write_header = True
+		elif opt == '-1':			single_pass = True
+		elif opt == '-b':			bit_basename = value; single_pass = True
 #		elif opt == '-o':			outfilename = value
 		else: 
 			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
@@ -210,24 +232,26 @@ def Main():
 	#		mark the number of species that are diagnosed for that patient
 	#		write a record for the patent specifying all the species found
 	#
-
-	# open a filename given on the command line.
-	fh=open(args[0])
+	#	In single pass mode, the species codes of each patient are kept while
+	#	collecting the species, and the records are written at the end.
+	#
 
 	species = {}
+	species_codes = {}
+	patients = []
+	n_patients = 0
 	
-	line_no = 0
-	for line in fh.readlines():
-		line = line.strip()
-		if (len(line) < 2):
-			continue
-		
-		line_no += 1
-		line = line.upper()
-		cols = line.split(',')
-
-		CollectSpecies(cols, species)
+	if (single_pass):
+		for records in OpenRecords(args[0]).Patients():
+			metrics.Switch("aggregate")
+			n_patients += 1
+			patients.append(CollectPatient(records, species, species_codes))
+	else:
+		for cols in OpenRecords(args[0]):
+			metrics.Switch("aggregate")
+			CollectSpecies(cols, species)
 
+	metrics.Switch("aggregate")
 	sorted_species_list = sorted(species.items(), key=operator.itemgetter(1),reverse=True)
 	#  sorted_species_list
 
@@ -243,46 +267,38 @@ def Main():
 				"Marital Status"
 			 ] 
 
+	attribute_names = header[:]
+
 	for s,c in sorted_species_list:
 		header.append(s)
 		
-	if (write_header):
+	if (write_header and not bit_basename):
 		print ",".join(header)
 			
-	fh.seek(0, 0)
-	current_patient = ""
-	records = []
-	n_patients = 0
-		
-	line_no = 0			
-	for line in fh.readlines():
-		line = line.strip()
-		if (len(line) < 2):
-			continue
-		
-		line_no += 1
-		line = line.upper()
-		cols = line.split(',')
-
-	#	print cols[0], "[%s, %s]"%(cols[2],cols[3])
-
+	if (single_pass):
+		# output column of each species code
+		column = [0] * len(species_codes)
+		for i, (s,c) in enumerate(sorted_species_list):
+			column[species_codes[s]] = i
+
+	metrics.Switch("write")
+	if (bit_basename):
+		WriteBitMatrix(bit_basename, attribute_names, header[len(attribute_names):], patients, column)
+	elif (single_pass):
+		for new_rec, codes in patients:
+			values = ['0'] * len(column)
+			for code in codes:
+				values[column[code]] = '1'
+			print ','.join(new_rec + values)
+	else:
 		# for each set of records for a patient
 		#		collect counts of each category of species
 		#		write new record with counts
 
-		if cols[0] != current_patient:
-			if (len(records) > 0):
-				n_patients += 1
-				ProcessRecords(records, species, sorted_species_list)
-					
-			records = []
-			current_patient = cols[0]
-
-		records.append(cols)	
-	
-	if (len(records) > 0):
-		n_patients += 1
-		ProcessRecords(records, species, sorted_species_list)		#process the last patient
+		for records in OpenRecords(args[0]).Patients():
+			metrics.Switch("write")
+			n_patients += 1
+			ProcessRecords(records, species, sorted_species_list)
 				
 	sys.stderr.write("# N Species: %d\n"%len(species))
 	sys.stderr.write("# Patients:  %d\n"%n_patients)
@@ -292,8 +308,8 @@ def Main():
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	
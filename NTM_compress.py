@@ -0,0 +1,232 @@
+# Compressed files of NTM patient records
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The record files read and written by the stages of the pipeline can be
+#	compressed with gzip, bzip2, xz or zstd.  The format of a file read is
+#	detected from its first bytes, the format of a file written from the
+#	extension of its name (.gz, .bz2, .xz, .zst).
+#
+#	Files are decompressed and compressed by the command line tool of the
+#	format, in a separate process, so the (de)compression overlaps the
+#	processing of the records by the script.  When the tool is not
+#	installed, gzip and bzip2 files are read with the gzip and bz2 modules
+#	in a background thread, which reads ahead of the records being parsed
+#	(zlib and bz2 release the interpreter lock while decompressing).
+#
+
+import string
+import sys, os, re
+import subprocess, threading, Queue
+import gzip, bz2
+from distutils.spawn import find_executable
+
+# name, extension, first bytes of the files, command line tool
+COMPRESSION_FORMATS = [
+	("gzip",	".gz",	"\x1f\x8b",				"gzip"),
+	("bzip2",	".bz2",	"BZh",					"bzip2"),
+	("xz",		".xz",	"\xfd7zXZ\x00",			"xz"),
+	("zstd",	".zst",	"\x28\xb5\x2f\xfd",		"zstd"),
+]
+MAGIC_SIZE = 6
+
+PIPE_BUFFER_SIZE = 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+READ_AHEAD_BLOCKS = 4
+
+###############################################################################
+# FormatOfName - the compression format given by the extension of filename
+# Returns: entry of COMPRESSION_FORMATS, or None if not compressed
+###############################################################################
+
+def FormatOfName(filename):
+
+	name = filename.lower()
+	for format in COMPRESSION_FORMATS:
+		if name.endswith(format[1]):
+			return format
+	return None
+
+# end of FormatOfName()
+
+###############################################################################
+# FormatOfFile - the compression format of a file, from its first bytes.
+#	Files that are not regular files (pipes) are not read, their format is
+#	given by their name.
+# Returns: entry of COMPRESSION_FORMATS, or None if not compressed
+###############################################################################
+
+def FormatOfFile(filename):
+
+	if (not os.path.isfile(filename)):
+		return FormatOfName(filename)
+
+	with open(filename, 'rb') as infile:
+		magic = infile.read(MAGIC_SIZE)
+	for format in COMPRESSION_FORMATS:
+		if magic.startswith(format[2]):
+			return format
+	return None
+
+# end of FormatOfFile()
+
+###############################################################################
+# DecompressedFile - the lines of a file decompressed by a command.
+#	An IOError is raised at the end of the lines if the command failed or
+#	was killed, so a truncated file is not taken for a complete one.  When
+#	the file is closed before the end of its lines, the command is stopped.
+###############################################################################
+class DecompressedFile(object):
+
+	def __init__(self, command, filename):
+		self.command = command
+		self.filename = filename
+		self.process = subprocess.Popen([command, "-dcq", filename], stdout=subprocess.PIPE, bufsize=PIPE_BUFFER_SIZE)
+		self.at_end = False
+
+	def __iter__(self):
+		for line in self.process.stdout:
+			yield line
+		self.at_end = True
+		self.close()
+
+	def close(self):
+		if (self.process.returncode != None):
+			return
+		if (not self.at_end):
+			# closed before the end of the lines, the status is not checked
+			self.process.terminate()
+			self.process.stdout.close()
+			self.process.wait()
+			return
+
+		self.process.stdout.close()
+		status = self.process.wait()
+		if (status != 0):
+			raise IOError("%s failed (status %d) to decompress [%s]"%(self.command, status, self.filename))
+
+# end of DecompressedFile
+
+###############################################################################
+# ThreadedReader - the lines of a file, read in blocks by a background
+#	thread, READ_AHEAD_BLOCKS ahead of the lines returned.
+###############################################################################
+class ThreadedReader(object):
+
+	def __init__(self, fh):
+		self.fh = fh
+		self.blocks = Queue.Queue(READ_AHEAD_BLOCKS)
+		self.thread = threading.Thread(target=self.ReadBlocks)
+		self.thread.daemon = True
+		self.thread.start()
+
+	# the background thread, an empty block marks the end of the file
+	def ReadBlocks(self):
+		try:
+			while True:
+				block = self.fh.read(READ_BLOCK_SIZE)
+				self.blocks.put(block)
+				if (not block):
+					break
+		except Exception, e:
+			self.blocks.put(e)
+
+	def __iter__(self):
+		rest = ""
+		while True:
+			block = self.blocks.get()
+			if isinstance(block, Exception):
+				raise block
+			if (not block):
+				break
+			lines = block.split("\n")
+			lines[0] = rest + lines[0]
+			rest = lines.pop()
+			for line in lines:
+				yield line + "\n"
+		if (rest):
+			yield rest
+
+	def close(self):
+		self.fh.close()
+
+# end of ThreadedReader
+
+###############################################################################
+# CompressedFile - a file written through a command that compresses it
+###############################################################################
+class CompressedFile(object):
+
+	def __init__(self, command, filename):
+		self.command = command
+		self.filename = filename
+		self.outfile = open(filename, 'wb')
+		self.process = subprocess.Popen([command, "-cq"], stdin=subprocess.PIPE, stdout=self.outfile, bufsize=PIPE_BUFFER_SIZE)
+
+	def write(self, text):
+		self.process.stdin.write(text)
+
+	def flush(self):
+		self.process.stdin.flush()
+
+	def close(self):
+		self.process.stdin.close()
+		status = self.process.wait()
+		self.outfile.close()
+		if (status != 0):
+			raise IOError("%s failed (status %d) to compress [%s]"%(self.command, status, self.filename))
+
+# end of CompressedFile
+
+###############################################################################
+# OpenInput - open a file for reading its lines, decompressing it if it is
+#	compressed.
+###############################################################################
+
+def OpenInput(filename):
+
+	format = FormatOfFile(filename)
+	if (format == None):
+		return open(filename)
+
+	name, extension, magic, command = format
+	path = find_executable(command)
+	if (path):
+		return DecompressedFile(path, filename)
+	if (name == "gzip"):
+		return ThreadedReader(gzip.open(filename, 'rb'))
+	if (name == "bzip2"):
+		return ThreadedReader(bz2.BZ2File(filename, 'r'))
+
+	raise IOError("%s is required to read the %s file [%s]"%(command, name, filename))
+
+# end of OpenInput()
+
+###############################################################################
+# OpenOutput - open a file for writing, compressed by the format of the
+#	extension of filename.  Uncompressed files are opened with a buffer of
+#	buffer_size bytes.
+###############################################################################
+
+def OpenOutput(filename, buffer_size=-1):
+
+	format = FormatOfName(filename)
+	if (format == None):
+		return open(filename, 'w', buffer_size)
+
+	name, extension, magic, command = format
+	path = find_executable(command)
+	if (path):
+		return CompressedFile(path, filename)
+	if (name == "gzip"):
+		return gzip.open(filename, 'wb')
+	if (name == "bzip2"):
+		return bz2.BZ2File(filename, 'w')
+
+	raise IOError("%s is required to write the %s file [%s]"%(command, name, filename))
+
+# end of OpenOutput()
+
+###############################################################################
+###############################################################################
@@ -0,0 +1,119 @@
+# Diagnostics of the records reported by the NTM_* scripts
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The scripts report unusual records (multiple species, records without a
+#	method, bad ages, ZIP codes without a ZCTA, ...) as events of the
+#	diagnostics, instead of writing a message to stderr for every record.
+#	Each event type is counted, and the ids of the first SAMPLE_SIZE records
+#	of each type are kept as examples.  A record id is a patient id, a ZIP
+#	code, or a tuple of (patient id, line number).  A summary table of the
+#	events is written to stderr when the script exits:
+#
+#		# Diagnostics:
+#		#    count  event                          examples
+#		#      312  multiple species               [1234:17] [1240:35] ...
+#
+#	When the environment variable NTM_VERBOSE_DIAGNOSTICS is set, the message
+#	of each event is also written to stderr, as it happens.
+#
+#	The worker processes of a script return their events with their results
+#	(see Take), which are added to the events of the script (see Merge).
+#
+
+import string
+import sys, os
+import atexit
+
+VERBOSE_VARIABLE = "NTM_VERBOSE_DIAGNOSTICS"
+SAMPLE_SIZE = 5
+
+###############################################################################
+# RecordIdText - the text of a record id: patient id, or patient id:line number
+###############################################################################
+
+def RecordIdText(record_id):
+
+	if isinstance(record_id, tuple):
+		return ":".join([str(part) for part in record_id])
+	return str(record_id)
+
+# end of RecordIdText()
+
+###############################################################################
+# Diagnostics - the counts and example record ids of each type of event
+###############################################################################
+class Diagnostics(object):
+
+	def __init__(self, verbose=False, sample_size=SAMPLE_SIZE):
+		self.verbose = verbose
+		self.sample_size = sample_size
+		self.events = []		# event types, in the order first reported
+		self.counts = {}
+		self.samples = {}
+
+	# Count an event of the record given by record_id.  The message is
+	# formatted with args and written to stderr only in verbose mode.
+	def Report(self, event, record_id, message=None, *args):
+		n = self.counts.get(event, 0)
+		if (n == 0):
+			self.events.append(event)
+			self.samples[event] = []
+		self.counts[event] = n + 1
+		if (n < self.sample_size):
+			self.samples[event].append(record_id)
+
+		if (self.verbose) and (message != None):
+			if (len(args) > 0):
+				message = message%args
+			sys.stderr.write(message)
+
+	# Returns: the events reported since the last call, as a picklable tuple
+	def Take(self):
+		taken = (self.events, self.counts, self.samples)
+		self.events = []
+		self.counts = {}
+		self.samples = {}
+		return taken
+
+	# Add the events returned by Take, of another process
+	def Merge(self, taken):
+		events, counts, samples = taken
+		for event in events:
+			n = self.counts.get(event, 0)
+			if (n == 0):
+				self.events.append(event)
+				self.samples[event] = []
+			self.counts[event] = n + counts[event]
+			room = self.sample_size - len(self.samples[event])
+			if (room > 0):
+				self.samples[event].extend(samples[event][:room])
+
+	# Write the table of the counts of the events, if any were reported
+	def WriteSummary(self, out=None):
+		if (len(self.events) == 0):
+			return
+		if (out == None):
+			out = sys.stderr
+
+		out.write("\n")
+		out.write("# Diagnostics:\n")
+		out.write("# %8s  %-30s %s\n"%("count", "event", "examples"))
+		for event in self.events:
+			examples = " ".join(["[%s]"%(RecordIdText(record_id)) for record_id in self.samples[event]])
+			if (self.counts[event] > len(self.samples[event])):
+				examples += " ..."
+			out.write("# %8d  %-30s %s\n"%(self.counts[event], event, examples))
+		if (not self.verbose):
+			out.write("# (set %s=1 to write the message of each event)\n"%(VERBOSE_VARIABLE))
+
+# end of Diagnostics
+
+# the diagnostics of this process, written when the script exits.
+# The worker processes of multiprocessing exit without running atexit.
+current = Diagnostics(verbose=bool(os.environ.get(VERBOSE_VARIABLE)))
+atexit.register(lambda: current.WriteSummary())
+
+###############################################################################
+###############################################################################
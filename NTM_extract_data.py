@@ -6,9 +6,72 @@
 #
 import string
 import sys, os, re, getopt
+import collections
+import NTM_diagnostics
 
 RECOGNIZED_METHODS = ["GEN", "GENPROBE", "BIOCHEMICAL", "BIOCHEMICALS", "RPOB", "16S", "MALDI-TOF"]
 
+# Keywords searched for in the text of the diagnosis
+SPECIES_WORDS = ["MYCOBACTERIUM", "M.", "M"]		# words that introduce a species name
+METHOD_WORDS = ["BY", "USING"]					# words that introduce a method name
+MYCOLIC_PHRASE = ["PROFILE", "MOST", "CLOSELY", "RESEMBLES"]	# words following 'mycolic acid'
+
+SPECIES_KEYWORD = 1
+METHOD_KEYWORD = 2
+MYCOLIC_KEYWORD = 3
+
+# mapping of each keyword to the kind of match it starts
+KEYWORDS = {"MYCOLIC" : MYCOLIC_KEYWORD}
+for w in SPECIES_WORDS:	KEYWORDS[w] = SPECIES_KEYWORD
+for w in METHOD_WORDS:	KEYWORDS[w] = METHOD_KEYWORD
+KEYWORD_SET = frozenset(KEYWORDS)
+
+# Patterns used to split the text of a diagnosis into sentences
+M_DOT_PATTERN = re.compile(r"^M. ")		# "M." at the start of the text, kept in the first sentence
+SENTENCE_PATTERN = re.compile(r'[.;]+')
+
+# Every keyword contains one of these strings, so sentences without them are not searched
+KEYWORD_FRAGMENTS = ("M", "BY", "USING")
+
+# Debug files written by ExtractData (see OpenDebugFiles).  None when not debugging.
+debug_extracted = None
+debug_ignored = None
+
+DEBUG_BUFFER_SIZE = 1024 * 1024
+
+# Number of diagnosis texts whose extracted names are remembered by ExtractData
+SCAN_CACHE_SIZE = 20000
+
+###############################################################################
+# LRUCache - dictionary of a limited number of entries.  When it is full,
+#	the least recently used entry is removed to add a new one.
+###############################################################################
+class LRUCache(object):
+
+	def __init__(self, size):
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		value = self.entries.pop(key, None)
+		if (value == None):
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.entries[key] = value	# move to most recently used
+		return value
+
+	def put(self, key, value):
+		if (len(self.entries) >= self.size):
+			self.entries.popitem(last=False)
+		self.entries[key] = value
+
+# end of LRUCache
+
+scan_cache = LRUCache(SCAN_CACHE_SIZE)
+
 ###############################################################################
 # StripWord - removes all the known punctuation and artifacts from the word
 ###############################################################################
@@ -23,17 +86,204 @@ def StripWord(w):
 # end of StripWord()
 
 
+###############################################################################
+# OpenDebugFiles - open the debug files written by ExtractData for the run.
+#	Records from which a species and method were extracted are written to 
+#	the first file, the other records to the second file.
+#	The files can be used to validate the extraction of the correct data 
+#	from the records.
+###############################################################################
+def OpenDebugFiles(extracted_filename="debug_extracted.csv", ignored_filename="debug_ignored.csv"):
+	global debug_extracted
+	global debug_ignored
+	
+	debug_extracted = open(extracted_filename, 'w', DEBUG_BUFFER_SIZE)
+	debug_ignored = open(ignored_filename, 'w', DEBUG_BUFFER_SIZE)
+# end of OpenDebugFiles()
+
+###############################################################################
+# CloseDebugFiles - flush and close the debug files written by ExtractData
+###############################################################################
+def CloseDebugFiles():
+	global debug_extracted
+	global debug_ignored
+	
+	if (debug_extracted != None):
+		debug_extracted.close()
+		debug_ignored.close()
+	debug_extracted = None
+	debug_ignored = None
+# end of CloseDebugFiles()
+
+
+###############################################################################
+# AddName - adds the name to the list, unless it is already in the list
+###############################################################################
+def AddName(names, name):
+	if name not in names:
+		names.append(name)
+# end of AddName()
+
+###############################################################################
+# TokenizeText - split the text of a diagnosis into the sentences searched
+#	for the species and methods.  Texts that are negative or unable to
+#	identify the species have no sentences, and sentences that cannot
+#	contain a keyword are left out.
+# Returns: list of (list of words, list of stripped words) of each sentence
+###############################################################################
+
+def TokenizeText(f):
+
+	if ("NEGATIVE" in f) or ("UNABLE" in f):
+		return [] # skip all of the sentences
+
+	# need to replace "M." with "M" to keep it in same sentence
+	f = M_DOT_PATTERN.sub("M ", f)
+
+	sentences = []
+	for s in SENTENCE_PATTERN.split(f):
+		for fragment in KEYWORD_FRAGMENTS:
+			if fragment in s:
+				break
+		else:
+			continue	# no keyword in the sentence
+
+		raw_words = s.split(' ')
+
+		# strip each word once, and skip sentences without any keywords
+		words = [StripWord(w) for w in raw_words]
+		if not KEYWORD_SET.isdisjoint(words):
+			sentences.append((raw_words, words))
+
+	return sentences
+
+# end of TokenizeText()
+
+###############################################################################
+# ScanText - search the text of a diagnosis for the species and methods.
+#	is_genprobe is True if the text is from the GENPROBE column, in which
+#	case GENPROBE is assumed when a species is found without a method.
+# Returns: (tuple of species names, tuple of method names, tuple of the
+#	(count, text) of each 'mycolic acid' phrase skipped), with the names in
+#	the order they were found
+###############################################################################
+
+def ScanText(f, is_genprobe, only_recognised_method=False):
+
+	species_names = []
+	method_names = []
+	skipped_phrases = []
+
+	# for each sentence, collect the species
+	
+	for raw_words, words in TokenizeText(f):
+		n_words = len(words)
+
+		still_checking_for_species = True  # set false if we find a complex species
+		
+		# search the keywords in the text for the species and method
+		for i,w in enumerate(words):
+			keyword = KEYWORDS.get(w)
+			if (keyword == None):
+				continue
+
+			next_word = ""
+			if (i < n_words-1): 
+				next_word = words[i+1]
+			third_word = ""
+			if (i < n_words-2): 
+				third_word = words[i+2]
+				
+			#  if we should look for avium complex after 'mycolic acid profile ... resembles'
+			if (keyword == MYCOLIC_KEYWORD):
+				if (not still_checking_for_species) or ("ACID" != next_word):
+					continue
+					
+				count = 0
+				for x in words[i+2:i+6]:
+					if x in MYCOLIC_PHRASE:
+						count += 1
+				# check to see that at least three words match the phrase.  
+				# Allows for misspelling of one word
+				if (count < 3): 
+					skipped_phrases.append((count, " ".join(raw_words[i+2:])))
+					continue  # to next word
+				
+				#check for M. avium complex consecutive in text
+				matched = False
+				for j in range (i+3,n_words-2):		# for each remaining word in sentence
+					if (words[j] in SPECIES_WORDS) and (words[j+1] == "AVIUM") and (words[j+2] == "COMPLEX"):
+						matched = True
+						break # out of phrase match on remaining words
+						
+				if matched:
+					AddName(species_names, "%s %s" %("M.", "AVIUM_COMPLEX"))
+					still_checking_for_species = False  # found a complex species
+					continue
+					
+				# the phrase search stops on the last word of the sentence,
+				# which is then checked in place of 'mycolic'
+				w = words[-1]
+				keyword = KEYWORDS.get(w)
+			# end MYCOLIC ACID check
+					
+			# check to see if this is an intro word for the species
+			if (keyword == SPECIES_KEYWORD) and (still_checking_for_species):
+				if (len(next_word) > 0):
+					species_name = next_word
+					if (species_name == "AVIUM") and (third_word == "COMPLEX"):
+						species_name = "AVIUM_COMPLEX"
+					if (species_name == "ABSCESSUS") and (third_word == "GROUP"):
+						species_name = "ABSCESSUS_GROUP"
+
+					AddName(species_names, "%s %s" %("M.", species_name))
+	
+			# check for the method with in the text
+			if (keyword == METHOD_KEYWORD):
+				method_name = next_word
+				key = method_name	 
+				if not only_recognised_method or (key in RECOGNIZED_METHODS):
+					AddName(method_names, key)
+		# end for each word
+	# end for each sentence
+	
+	if (len(species_names) > 0) and (len(method_names) == 0):
+		if (is_genprobe):	# can we assume GENPROBE?
+			method_names.append("GENPROBE")
+	
+	return (tuple(species_names), tuple(method_names), tuple(skipped_phrases))
+
+# end of ScanText()
+
+###############################################################################
+# CachedScanText - ScanText, remembering the results of the most recently
+#	used texts in scan_cache.
+###############################################################################
+
+def CachedScanText(f, is_genprobe, only_recognised_method=False):
+
+	key = (f, is_genprobe, only_recognised_method)
+	result = scan_cache.get(key)
+	if (result == None):
+		result = ScanText(f, is_genprobe, only_recognised_method)
+		scan_cache.put(key, result)
+	return result
+
+# end of CachedScanText()
+
 ###############################################################################
 # Extract the species and methods from this individual record.
 #	Select the column from which to extract the data
 #	Search for keywords in the text specifying the species and method diagnosed.
+#	The names found in a text are remembered (see ScanText), so repeated
+#	texts are only searched once.
 # Returns: dict of species and dict of methods extracted
 ###############################################################################
 
 def ExtractData(rec, only_recognised_method=False):
 
-# for debugging, we generate a file of records from which species was extracted
-# and a second file with records that did not have a species extracted.
+# for debugging, when the debug files are open, we write a file of records from which 
+# species was extracted and a second file with records that did not have a species extracted.
 # These file scan be used to validate the extraction of the correct data from the records.
 	
 	rec_species = {}
@@ -64,13 +314,6 @@ def ExtractData(rec, only_recognised_method=False):
 	# get the line number for this record (appended as last col in record)
 	line_no = rec[-1]		
 
-	debugging = True
-	if (debugging and line_no <= 1):
-		debug_file = open("debug_extracted.csv", 'w')
-		debug_file.close()
-		debug_file = open("debug_ignored.csv", 'w')
-		debug_file.close()
-
 	# find the text describing the diagnosis
 	f = rec[GENPROBE]
 	diagnosis_col = GENPROBE
@@ -89,142 +332,28 @@ def ExtractData(rec, only_recognised_method=False):
 			f = rec[HPLC_2]
 			diagnosis_col = HPLC_2
 
-	# need to replace "M." with "M" to keep it in same sentence
-	fp = re.sub(r"^M. ", "M ", f)
-##	if (fp != f): sys.stderr.write("===> [%d][%10s] M. processing [%s][%s]\n"%(rec[-1], rec[0], f,fp))
-	f = fp
-	
-	sentences = re.split(r'[.;]+', f)
-	
-	# for each sentence, collect the species
-	
-	for s in sentences:
-		words=s.split(' ') # f.split(' ')
-
-	#	if rec[0] == "2756708":
-	# 	if rec[0] == "74761":
-	# 		sys.stderr.write("===> processing [%s][%d] from field %d\n"%(rec[0], rec[-1], diagnosis_col))
-	# 		for w in words:
-	# 			sys.stderr.write("[%s]"%w)
-	# 		sys.stderr.write("\n")
-			
-		if ("NEGATIVE" in f) or ("UNABLE" in f):
-	#		print "found neg"
-			##return rec_species, rec_methods
-			continue # skip the rest of the sentence
-
-		still_checking_for_species = True  # set false if we find a complex species
-		
-		# search each word of the text for the species and method
-		for i,w in enumerate(words):
-			w = StripWord(w)
-			next_word = ""
-			if (i < len(words)-1): 
-				next_word = StripWord(words[i+1])
-			third_word = ""
-			if (i < len(words)-2): 
-				third_word = StripWord(words[i+2])
-				
-	#		if rec[0] == "2756708": 			sys.stderr.write("===> Word,next word: [%s][%s]\n"%(w,next_word))
+	species_names, method_names, skipped_phrases = CachedScanText(f, diagnosis_col == GENPROBE, only_recognised_method)
 
-			#  if we should look for avium complex after 'mycolic acid profile ... resembles'
-			if (True and still_checking_for_species):
-				if ("MYCOLIC"==w) and ("ACID"==next_word):
-					# 
-#					sys.stderr.write("\tchecking for avium complex, after finding 'mycolic acid' [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[i+2:])))
-					special = ["PROFILE", "MOST", "CLOSELY", "RESEMBLES"]
-					
-					count = 0
-					for j in range (i+2,i+6):
-						w = StripWord(words[j])
-						if w in special:
-							count += 1
-					# check to see that at least three words match the phrase.  
-					# Allows for misspelling of one word
-				#	if (count < 4):
-				#		sys.stderr.write("[%s][%s] Partial phrase match [%d of 4], after finding 'mycolic acid' : [%s]\n"%(rec[0],rec[-1],count," ".join(words[i+2:])))
-					if (count < 3): 
-						sys.stderr.write("[%s][%s] skipping phrase match [%d of 4], after finding 'mycolic acid' : [%s]\n"%(rec[0],rec[-1],count," ".join(words[i+2:])))
-						continue  # to next word
-					
-					#check for M. avium complex consecutive in text
-					special_avium = [["M", "M.", "MYCOBACTERIUM"], ["AVIUM"], ["COMPLEX"]]
-					matched = False
-				
-					for j in range (i+3,len(words)):		# for each remaining word in sentence
-						matched = True				# 	assume match
-						for k in range(3):			# 	look for consecutive match to phrase
-							w = StripWord(words[j+k])	
-							if w not in special_avium[k]:	
-								matched = False
-								break
-					#		sys.stderr.write("\tpartial M,A,C [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[j:j+k+1])))
-	
-						if matched: 
-					#		sys.stderr.write("\tfound M,A,C [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[j:j+3])))
-							break # out of phrase match on remaining words
-							
-					if matched:
-						key="%s %s" %("M.", "AVIUM_COMPLEX")  
-					#	sys.stderr.write("\tfound MAC [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[i+2:])))
-					#	sys.stderr.write("\t[%d][%s]\n"%(line_no, key))
-					#	print "\t\tSpecies:",line_no, key
-						if not rec_species.has_key(key):
-							rec_species[key] = [line_no]
-						else:
-							if (rec_species[key][-1] != line_no):
-								rec_species[key].append(line_no)
-						still_checking_for_species = False  # found a complex species
-					####break  # out of word processing, ignore all other species???  
-				#	elif (count > 0):
-				#		sys.stderr.write("\tdid not find MAC [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[i+2:])))
-				#	else:
-				#		sys.stderr.write("\tdid not find MAC [%s][%s] [%s]\n"%(rec[0],rec[-1]," ".join(words[i+2:])))
-			# end MYCOLIC ACID check
-					
-			# check to see if this is an intro word for the species
-	#		if ("M." == w) or ('M' == w):
-	#			sys.stderr.write("===> Species: [%10s][%s][%s]\n"%(rec[0], w,next_word))
+	diagnostics = NTM_diagnostics.current
+	for count, text in skipped_phrases:
+		diagnostics.Report("skipping phrase match", (rec[0],rec[-1]),
+			"[%s][%s] skipping phrase match [%d of 4], after finding 'mycolic acid' : [%s]\n", rec[0],rec[-1],count,text)
 
-			if (still_checking_for_species):
-				if (("MYCOBACTERIUM" == w) or ("M." == w) or ('M' == w)) and (len(next_word) > 0):
-					if rec[0] == "60597130": sys.stderr.write("===> Species[%s]: [%s][%s]\n"%(s,w,next_word))
-					#print neg_string, "M.", words[i+1]
-					species_name = next_word
-					if (species_name == "AVIUM") and (third_word == "COMPLEX"):
-						species_name = "AVIUM_COMPLEX"
-					if (species_name == "ABSCESSUS") and (third_word == "GROUP"):
-						species_name = "ABSCESSUS_GROUP"
+	# attach the line number to the names found
+	for name in species_names:
+		rec_species[name] = [line_no]
+	for name in method_names:
+		rec_methods[name] = [line_no]
 
-					key="%s %s" %("M.", species_name)  
-				#	print "Species:",line_no, key
-					if not rec_species.has_key(key):
-						rec_species[key] = [line_no]
-					else:
-						if (rec_species[key][-1] != line_no):
-							rec_species[key].append(line_no)
+	if (len(rec_species) > 1) and (len(rec_methods) > 0):
+		diagnostics.Report("multiple species", (rec[0],rec[-1]),
+			"===> [%d][%10s] Multiple Species:[%s][%s]\n", rec[-1],rec[0], ':'.join(rec_species), ':'.join(rec_methods))
+		key="%s %s" %("M.", "AVIUM_COMPLEX")  
+		if rec_species.has_key(key):
+			diagnostics.Report("avium complex detected", (rec[0],rec[-1]),
+				"===> [%d][%10s] AVIUM COMPLEX detected\n", rec[-1],rec[0])
 	
-			# check for the method with in the text
-			if ("BY"==w) or ("USING"==w):
-	#			if rec[0] == "74761": 			sys.stderr.write("===> Method: [%s][%s]\n"%(w,next_word))
-				method_name = next_word
-				key = method_name	 
-				if not only_recognised_method or (key in RECOGNIZED_METHODS):
-			#		print "Method:", line_no, key
-					if not rec_methods.has_key(key):
-						rec_methods[key] = [line_no]
-					else:
-						if (rec_methods[key][-1] != line_no):
-							rec_methods[key].append(line_no)
-		# end for each word
-	# end for each sentence
-	
-	if (len(rec_species) > 0) and (len(rec_methods) == 0):
-		if (diagnosis_col == GENPROBE):	# can we assume GENPROBE?
-			rec_methods["GENPROBE"] = [line_no] 
-	
-	debugging = True
-	if (debugging):
+	if (debug_extracted != None):
 		species = ':'.join(rec_species)
 		methods = ':'.join(rec_methods)
 		record  = ','.join(rec[:-1])  # leave off last col which is a integer line #
@@ -232,19 +361,11 @@ def ExtractData(rec, only_recognised_method=False):
 			species = "species"
 			methods = "methods"
 		if (len(rec_species) > 0) and (len(rec_methods) > 0):
-			debug_file = open("debug_extracted.csv", 'a')
-			if (len(rec_species) > 1):
-				sys.stderr.write("===> [%d][%10s] Multiple Species:[%s][%s]\n"%(rec[-1],rec[0], species, methods))
-				key="%s %s" %("M.", "AVIUM_COMPLEX")  
-				if rec_species.has_key(key):
-					sys.stderr.write("===> [%d][%10s] AVIUM COMPLEX detected\n"%(rec[-1],rec[0]))
-				
+			debug_file = debug_extracted
 		else:
-			debug_file = open("debug_ignored.csv", 'a')
+			debug_file = debug_ignored
 
-		str = "%d,[%s],[%s],%s\n"%(rec[-1], species, methods, record)
-		debug_file.write(str)
-		debug_file.close()
+		debug_file.write("%d,[%s],[%s],%s\n"%(rec[-1], species, methods, record))
 
 	return rec_species, rec_methods
 
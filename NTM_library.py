@@ -0,0 +1,143 @@
+# In-process interface to the extraction and aggregation of NTM patient data
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The NTM_* scripts keep their options in module globals and write to
+#	stdout.  The classes here keep the options in the object, take iterables
+#	of records and return the results, so several stages of the pipe line
+#	can run in a single process without writing and reading the files
+#	between them.
+#
+#	Example, counting the diagnosed patients in each ZCTA:
+#
+#		extractor = Extractor(only_recognised_method=True)
+#		reader = RecordReader(open("NTM_Non_CF_patients.csv"), line_numbers=True)
+#		diagnosed = extractor.Records(reader.Patients())
+#
+#		aggregator = CategoryAggregator("RAPID_SLOW_CATEGORIES.txt", ZctaIndex(), ["ANY", "1", "2"])
+#		counts = aggregator.AddPatients(diagnosed.Patients())
+#		# counts["1"] is a dict of ZCTA to number of patients with a RAPID species
+#
+
+import string
+import sys, os, re
+from NTM_read_data import RecordReader
+from NTM_extract_data import ExtractData
+from NTM_species_per_patient import PatientSpecies
+from NTM_zcta import LoadZCTATables, ZipToZCTA, ZCTAToState
+from NTM_categories import LoadCategories, CategoryMasks, PatientCategories, PatientMatches, ParseSelector
+
+###############################################################################
+# Extractor - extracts the species and methods from the patient records
+#	(NTM_extract_data.ExtractData and NTM_species_per_patient.ProcessRecords)
+#
+#	The records must have the line number as the last column, as read by
+#	RecordReader(fh, line_numbers=True).
+###############################################################################
+class Extractor(object):
+
+	def __init__(self, only_recognised_method=False, undiagnosed_patients=False):
+		self.only_recognised_method = only_recognised_method
+		self.undiagnosed_patients = undiagnosed_patients
+
+	# Returns: (dict of species, dict of methods) extracted from a record
+	def Extract(self, rec):
+		return ExtractData(rec, self.only_recognised_method)
+
+	# Returns: (patient id, dict of species, list of output lines) of a patient
+	def Patient(self, records):
+		return PatientSpecies(records, self.only_recognised_method, self.undiagnosed_patients)
+
+	# Yields the result of Patient() for each patient
+	def Patients(self, patients):
+		for records in patients:
+			yield self.Patient(records)
+
+	# Yields the output lines of the patients, the lines NTM_species_per_patient writes
+	def Lines(self, patients):
+		for patient_id, patient_species, output_lines in self.Patients(patients):
+			for line in output_lines:
+				yield line
+
+	# Returns: a RecordReader of the output lines, for the next stage of the pipe line
+	def Records(self, patients):
+		return RecordReader(self.Lines(patients))
+
+# end of Extractor
+
+###############################################################################
+# ZctaIndex - mapping of zip codes to ZCTA and of ZCTA to state
+#	(NTM_zcta.LoadZCTA, Lookup_ZCTA and Lookup_ZCTA_State)
+###############################################################################
+class ZctaIndex(object):
+
+	def __init__(self, filename="zipcodezctatable.txt"):
+		self.zip_to_zcta, self.zcta_to_state = LoadZCTATables(filename)
+
+	# Returns: the ZCTA of the zip code, or None if the zip code is unknown
+	def Lookup(self, zip_str):
+		return ZipToZCTA(self.zip_to_zcta, zip_str)
+
+	# Returns: the state of the ZCTA, or None if the ZCTA is unknown
+	def State(self, zcta):
+		return ZCTAToState(self.zcta_to_state, zcta)
+
+# end of ZctaIndex
+
+###############################################################################
+# CategoryAggregator - counts the patients in each ZCTA with a diagnosis in
+#	the selected categories (NTM_ZCTA_category_aggregate.AggregatePatients)
+#
+#	categories is the name of a categories file, or the list returned by
+#	LoadCategories.  Each selector is a 1 based category number, ANY or
+#	OTHER (as for the -w option of NTM_ZCTA_category_counts).
+#	Raises ValueError for a selector that is not valid.
+###############################################################################
+class CategoryAggregator(object):
+
+	def __init__(self, categories, zcta_index, selectors=["ANY"]):
+		if isinstance(categories, basestring):
+			categories = LoadCategories(categories)
+		self.categories = categories
+		self.category_masks = CategoryMasks(categories)
+		self.zcta_index = zcta_index
+
+		self.selectors = []
+		self.outputs = []
+		for selector in selectors:
+			output = ParseSelector(selector, categories)
+			if (output == None):
+				raise ValueError("invalid category selector [%s]"%(selector))
+			self.selectors.append(selector.strip().upper())
+			self.outputs.append(output)
+
+		self.counts = [{} for s in self.selectors]
+		self.n_patients = 0
+
+	# Count the patient of the records in the ZCTA of every matching selector
+	def Add(self, records):
+		self.n_patients += 1
+		pid, zcta, patient_mask, count_other = PatientCategories(records, self.category_masks, self.zcta_index.Lookup)
+		if (not pid):
+			return
+
+		for i, (name, want_any, want_other, category) in enumerate(self.outputs):
+			if PatientMatches(patient_mask, count_other, want_any, want_other, category):
+				self.counts[i][zcta] = self.counts[i].get(zcta, 0) + 1
+
+	# Count the patients, returns Counts()
+	def AddPatients(self, patients):
+		for records in patients:
+			self.Add(records)
+		return self.Counts()
+
+	# Returns: dict of selector to dict of ZCTA to number of patients
+	def Counts(self):
+		return dict(zip(self.selectors, self.counts))
+
+	# Returns: the name of the category of the selector (the column name of the output)
+	def Name(self, selector):
+		return self.outputs[self.selectors.index(selector.strip().upper())][0]
+
+# end of CategoryAggregator
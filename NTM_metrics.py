@@ -0,0 +1,238 @@
+# Run metrics of the NTM_* scripts
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	When the environment variable NTM_METRICS_DIR is set to a directory, each
+#	script writes a JSON file of the metrics of its run to the directory:
+#
+#		script, argv		the script and its command line
+#		start				start time (seconds since the epoch)
+#		wall_seconds		elapsed time
+#		user_seconds		CPU time, including the worker processes
+#		system_seconds
+#		max_rss_kb			peak resident memory of the script (and of its largest worker process)
+#		counts				rows read, patients read, ...
+#		rates				rows and patients per wall clock second
+#		phases				seconds spent in each phase of the run:
+#							setup, read, parse, extract, aggregate, write
+#
+#	The time of a phase is measured between the calls of Switch(), so the
+#	phases add up to the wall time.  RecordReader switches to the read and
+#	parse phases, the scripts switch to their processing and write phases.
+#
+#	When NTM_METRICS_DIR is not set, the metrics are not collected.
+#
+#	The metrics files of the runs in a directory are collected in a single
+#	report by:
+#		python NTM_metrics.py [-j report.json] <metrics_dir> > report.txt
+#
+
+import string
+import sys, re, os, getopt
+import atexit, json, resource, time
+
+METRICS_DIR_VARIABLE = "NTM_METRICS_DIR"
+PHASES = ["setup", "read", "parse", "extract", "aggregate", "write"]
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] <metrics_dir> \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t Writes a report of the metrics files of the runs in metrics_dir, in the order of the runs.\n')
+	sys.stderr.write( '\t      -j <filename>  also write the metrics of all the runs to filename as a JSON list\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# RunMetrics - the metrics of a run of a script
+###############################################################################
+class RunMetrics(object):
+
+	enabled = True
+
+	def __init__(self, name, metrics_dir):
+		self.name = name
+		self.metrics_dir = metrics_dir
+		self.argv = list(sys.argv)
+		self.start = time.time()
+		self.start_times = os.times()
+		self.counts = {}
+		self.phases = {}
+		self.phase = "setup"
+		self.phase_start = self.start
+
+	# Start the phase, adding the time since the last switch to the current phase
+	def Switch(self, phase):
+		now = time.time()
+		self.phases[self.phase] = self.phases.get(self.phase, 0.0) + (now - self.phase_start)
+		self.phase = phase
+		self.phase_start = now
+
+	def Count(self, name, n=1):
+		self.counts[name] = self.counts.get(name, 0) + n
+
+	# Returns: dict of the metrics of the run so far
+	def Result(self):
+		self.Switch(self.phase)
+		wall = time.time() - self.start
+		times = os.times()
+		max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+			resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+		rates = {}
+		for name in ["rows", "patients"]:
+			if (name in self.counts):
+				rates[name + "_per_second"] = self.counts[name] / max(wall, 0.001)
+
+		return {"script": self.name, "argv": self.argv, "pid": os.getpid(), "start": self.start,
+			"wall_seconds": wall,
+			"user_seconds": (times[0] + times[2]) - (self.start_times[0] + self.start_times[2]),
+			"system_seconds": (times[1] + times[3]) - (self.start_times[1] + self.start_times[3]),
+			"max_rss_kb": max_rss, "counts": self.counts, "rates": rates, "phases": self.phases}
+
+	# Write the metrics file of the run
+	def Write(self):
+		if (not os.path.isdir(self.metrics_dir)):
+			os.makedirs(self.metrics_dir)
+		filename = os.path.join(self.metrics_dir, "%s_%s_%d.json"%(self.name,
+			time.strftime("%Y%m%d-%H%M%S", time.localtime(self.start)), os.getpid()))
+		with open(filename, 'w') as outfile:
+			json.dump(self.Result(), outfile, indent=1, sort_keys=True)
+
+# end of RunMetrics
+
+###############################################################################
+# NullMetrics - metrics that are not collected
+###############################################################################
+class NullMetrics(object):
+
+	enabled = False
+
+	def Switch(self, phase):
+		pass
+
+	def Count(self, name, n=1):
+		pass
+
+# end of NullMetrics
+
+# the metrics of the run of this process
+current = NullMetrics()
+
+###############################################################################
+# StartMetrics - start collecting the metrics of the run, if NTM_METRICS_DIR
+#	is set.  The metrics file is written when the script exits.
+#	name defaults to the name of the script.
+# Returns: the metrics of the run (see current)
+###############################################################################
+
+def StartMetrics(name=None):
+
+	global current
+
+	metrics_dir = os.environ.get(METRICS_DIR_VARIABLE)
+	if (not metrics_dir) or (current.enabled):
+		return current
+
+	if (name == None):
+		name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+	current = RunMetrics(name, metrics_dir)
+	atexit.register(current.Write)
+	return current
+
+# end of StartMetrics()
+
+###############################################################################
+# LoadMetrics - load the metrics files of a directory
+# Returns: list of the metrics of the runs, in the order they started
+###############################################################################
+
+def LoadMetrics(metrics_dir):
+
+	runs = []
+	for filename in os.listdir(metrics_dir):
+		if (not filename.endswith(".json")):
+			continue
+		try:
+			with open(os.path.join(metrics_dir, filename), 'r') as infile:
+				runs.append(json.load(infile))
+		except ValueError:
+			sys.stderr.write("Skipping metrics file [%s], not valid JSON\n"%(filename))
+
+	runs.sort(key=lambda run: run["start"])
+	return runs
+
+# end of LoadMetrics()
+
+###############################################################################
+# WriteReport - write a table of the metrics of the runs, one line per run
+###############################################################################
+
+def WriteReport(out, runs):
+
+	out.write("%-34s %8s %8s %10s %10s %10s %9s  %s  %s\n"%("script", "wall", "cpu", "rows", "rows/s", "patients/s",
+		"rss_mb", " ".join(["%8s"%p for p in PHASES]), "arguments"))
+
+	total_wall = 0.0
+	slowest = None
+	for run in runs:
+		cpu = run["user_seconds"] + run["system_seconds"]
+		phases = " ".join(["%8.2f"%run["phases"].get(p, 0.0) for p in PHASES])
+		out.write("%-34s %8.2f %8.2f %10d %10.0f %10.0f %9.1f  %s  %s\n"%(run["script"], run["wall_seconds"], cpu,
+			run["counts"].get("rows", 0), run["rates"].get("rows_per_second", 0), run["rates"].get("patients_per_second", 0),
+			run["max_rss_kb"] / 1024.0, phases, " ".join(run["argv"][1:])))
+
+		total_wall += run["wall_seconds"]
+		if (slowest == None) or (run["wall_seconds"] > slowest["wall_seconds"]):
+			slowest = run
+
+	out.write("\n")
+	out.write("# Runs:          %d\n"%len(runs))
+	out.write("# Total seconds: %.2f\n"%total_wall)
+	if (slowest != None):
+		out.write("# Slowest run:   %s %s (%.2f seconds)\n"%(slowest["script"], " ".join(slowest["argv"][1:]), slowest["wall_seconds"]))
+
+# end of WriteReport()
+
+###############################################################################
+#
+# Main application processing
+#
+###############################################################################
+
+def Main():
+
+	json_filename = None
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "j:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-j':			json_filename = value
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	if (len(args) < 1):
+		Usage()
+		exit(-1)
+
+	runs = LoadMetrics(args[0])
+	WriteReport(sys.stdout, runs)
+
+	if (json_filename):
+		with open(json_filename, 'w') as outfile:
+			json.dump(runs, outfile, indent=1, sort_keys=True)
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	Main()
+
+###############################################################################
+###############################################################################
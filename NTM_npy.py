@@ -0,0 +1,62 @@
+# Writing arrays in the NumPy .npy file format
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The files are written without NumPy, so the data sets can be built where
+#	it is not installed.  They can be loaded with numpy.load(filename), or
+#	memory mapped with numpy.load(filename, mmap_mode='r').
+#
+#	File format (version 1.0):
+#		magic string "\x93NUMPY", major and minor version bytes
+#		header length (little endian unsigned short)
+#		header: repr of a dict of descr, fortran_order and shape,
+#			padded with spaces and ending with '\n' so the data is aligned
+#		array data in C order
+#
+
+import string
+import sys, os, re
+import struct
+
+NPY_MAGIC = "\x93NUMPY\x01\x00"
+NPY_ALIGNMENT = 64
+
+###############################################################################
+# NpyHeader - create the header of a .npy file
+#	descr is the NumPy type string of the data (e.g. '|u1', '<i4')
+#	shape is a tuple of the dimensions of the array
+###############################################################################
+
+def NpyHeader(descr, shape):
+
+	shape = tuple([int(n) for n in shape])
+	if (len(shape) == 1):
+		shape_str = "(%d,)"%shape
+	else:
+		shape_str = "(%s)"%(", ".join(["%d"%n for n in shape]))
+
+	header = "{'descr': '%s', 'fortran_order': False, 'shape': %s, }"%(descr, shape_str)
+
+	# pad the header so the array data starts on an aligned offset
+	length = len(NPY_MAGIC) + 2 + len(header) + 1
+	header += ' ' * ((NPY_ALIGNMENT - length % NPY_ALIGNMENT) % NPY_ALIGNMENT) + '\n'
+
+	return NPY_MAGIC + struct.pack("<H", len(header)) + header
+
+# end of NpyHeader()
+
+###############################################################################
+# WriteNpy - write an array to a .npy file
+#	rows is a sequence of strings of the array data in C order, normally
+#	one string per row of the array
+###############################################################################
+
+def WriteNpy(filename, descr, shape, rows):
+
+	with open(filename, 'wb') as outfile:
+		outfile.write(NpyHeader(descr, shape))
+		for row in rows:
+			outfile.write(row)
+
+# end of WriteNpy()
@@ -0,0 +1,542 @@
+# Incremental runner of the NTM data analysis pipe line
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	Runs the stages of NTM_build_datasets.sh (and NTM_build_data_counts.sh,
+#	NTM_build_data_attr.sh), skipping the stages whose outputs are up to date.
+#
+#	Each stage is a command with its input and output files.  A stage that
+#	reads the output of another stage depends on it, and the stages are run
+#	in the order of their dependencies.
+#
+#	The cache key of a stage is a hash of:
+#		the command line of the stage (script and options)
+#		the contents of the scripts, including the NTM_* modules they import
+#		the contents of the input files
+#	After a stage runs, its key and the hashes of its outputs are saved in
+#	the cache file of the output directory.  A stage is skipped when its key
+#	is the same as the saved key and its outputs have not changed since.
+#	When a stage reruns but writes the same outputs, the stages that depend
+#	on it are skipped.
+#
+#	With -j <n>, up to n stages that do not depend on each other run at the
+#	same time.  The stderr of each stage is written to the log when it
+#	finishes, after its command line.
+#
+#	Usage: python NTM_pipeline.py [options] [results_dir]  2> build.txt
+#
+
+import string
+import sys, re, os, getopt
+import hashlib, json, subprocess, tempfile, time
+import NTM_compress
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILENAME = ".NTM_pipeline_cache.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+INPUT_FILE = "Lipner_NTM_CO_FINAL2.csv"
+CF_PATIENT_IDS = "NTM_CF_patient_ids.csv"
+ZCTA_TABLE = "zipcodezctatable.txt"
+ZCTA_INDEX = ZCTA_TABLE + ".idx"		# see NTM_zcta.IndexFilename
+CF_PATIENTS = "NTM_CF_patients.csv"
+NON_CF_PATIENTS = "NTM_Non_CF_patients.csv"
+SUMMARY = "summary.txt"
+UNDIAGNOSED = "multi_per_patient_undiagnosed.csv"
+DIAGNOSED = "multi_per_patient_diagnosed.csv"
+STATE_DIAGNOSED = "%s_only_per_patient.csv"
+PATIENT_SPECIES = "species_freq.csv"
+
+# species of INDIVIDUAL_CATEGORIES.txt, in the order of the categories
+INDIVIDUAL_SPECIES = ["ABSCESSUS", "AVIUM", "AVIUM_COMPLEX", "INTRACELLULARE", "CHIMAERA", "CHELONAE",
+	"FORTUITUM", "SIMIAE", "GORDONAE", "KANSASII", "MASSILIENSE", "MUCOGENICUM", "PEREGRINUM"]
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] [results_dir] \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t Runs the stages of the data analysis pipe line whose outputs are not up to date.\n')
+	sys.stderr.write( '\t      -i <filename>  source data [default: %s]\n'%(INPUT_FILE))
+	sys.stderr.write( '\t      -c <filename>  CF patient ids [default: %s]\n'%(CF_PATIENT_IDS))
+	sys.stderr.write( '\t      -s <states>    comma separated list of states to create data sets for [default: CO]\n')
+	sys.stderr.write( '\t      -j <n>  number of stages to run at the same time [default: 1]\n')
+	sys.stderr.write( '\t      -z <ext>  compress the record files passed between the stages: .gz, .bz2, .xz or .zst\n')
+	sys.stderr.write( '\t      -f   force all the stages to run\n')
+	sys.stderr.write( '\t      -n   only list the stages that would run\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# Stage - a command of the pipe line, with its input and output files.
+#	command is the list of arguments, the first is the name of the NTM_*
+#	script.  If stdout is given, the output of the command is written to
+#	that file.  The stdout file is included in the outputs.
+###############################################################################
+class Stage(object):
+
+	def __init__(self, name, description, command, inputs, outputs=[], stdout=None):
+		self.name = name
+		self.description = description
+		self.command = command
+		self.inputs = inputs
+		self.outputs = list(outputs)
+		self.stdout = stdout
+		if (stdout):
+			self.outputs.append(stdout)
+
+	def Script(self):
+		return os.path.join(SCRIPT_DIR, self.command[0])
+
+	def CommandLine(self):
+		line = "%s %s"%(os.path.basename(sys.executable), " ".join(self.command))
+		if (self.stdout):
+			line += " > %s"%(self.stdout)
+		return line
+
+# end of Stage
+
+###############################################################################
+# FileHasher - hashes of the contents of files.
+#	The hash of a file is reused while its size and modification time are
+#	the same as when it was hashed.  known is a dict of filename to
+#	[size, mtime, hash], saved in the cache file.
+###############################################################################
+class FileHasher(object):
+
+	def __init__(self, known):
+		self.known = known
+
+	def Hash(self, filename):
+		try:
+			st = os.stat(filename)
+		except OSError:
+			return None
+		entry = self.known.get(filename)
+		if (entry) and (entry[0] == st.st_size) and (entry[1] == st.st_mtime):
+			return entry[2]
+
+		h = hashlib.sha1()
+		with open(filename, 'rb') as infile:
+			while True:
+				block = infile.read(HASH_BLOCK_SIZE)
+				if (not block):
+					break
+				h.update(block)
+		self.known[filename] = [st.st_size, st.st_mtime, h.hexdigest()]
+		return h.hexdigest()
+
+# end of FileHasher
+
+###############################################################################
+# ScriptModules - the script and the NTM_* modules it imports (recursively)
+###############################################################################
+
+IMPORT_PATTERN = re.compile(r'^\s*(?:from|import)\s+(NTM_\w+)', re.MULTILINE)
+
+def ScriptModules(script):
+
+	modules = []
+	pending = [script]
+	while (len(pending) > 0):
+		filename = pending.pop()
+		if (filename in modules) or (not os.path.exists(filename)):
+			continue
+		modules.append(filename)
+		with open(filename, 'r') as infile:
+			for name in IMPORT_PATTERN.findall(infile.read()):
+				pending.append(os.path.join(SCRIPT_DIR, name + ".py"))
+
+	return sorted(modules)
+
+# end of ScriptModules()
+
+###############################################################################
+# StageKey - the cache key of a stage
+# Returns: the key, or None if an input is missing
+###############################################################################
+
+def StageKey(stage, hasher):
+
+	h = hashlib.sha1()
+	h.update("\0".join(stage.command) + "\0")
+	if (stage.stdout):
+		h.update("stdout:" + stage.stdout + "\0")
+	for filename in ScriptModules(stage.Script()) + stage.inputs:
+		file_hash = hasher.Hash(filename)
+		if (file_hash == None):
+			sys.stderr.write("Missing input [%s] of stage [%s]\n"%(filename, stage.name))
+			return None
+		h.update("%s\0%s\0"%(filename, file_hash))
+
+	return h.hexdigest()
+
+# end of StageKey()
+
+###############################################################################
+# OrderStages - sort the stages in the order of their dependencies.
+#	A stage depends on the stages that write its inputs.
+###############################################################################
+
+def OrderStages(stages):
+
+	writer = {}
+	for stage in stages:
+		for filename in stage.outputs:
+			writer[filename] = stage
+
+	ordered = []
+	state = {}			# name of stage to 1 while visiting, 2 when done
+
+	def Visit(stage):
+		if (state.get(stage.name) == 2):
+			return
+		if (state.get(stage.name) == 1):
+			raise ValueError("cycle in the pipe line at stage [%s]"%(stage.name))
+		state[stage.name] = 1
+		for filename in stage.inputs:
+			if (filename in writer):
+				Visit(writer[filename])
+		state[stage.name] = 2
+		ordered.append(stage)
+
+	for stage in stages:
+		Visit(stage)
+
+	return ordered
+
+# end of OrderStages()
+
+###############################################################################
+# StageDependencies - the names of the stages each stage depends on
+# Returns: dict of stage name to set of stage names
+###############################################################################
+
+def StageDependencies(stages):
+
+	writer = {}
+	for stage in stages:
+		for filename in stage.outputs:
+			writer[filename] = stage.name
+
+	dependencies = {}
+	for stage in stages:
+		dependencies[stage.name] = set([writer[f] for f in stage.inputs if f in writer])
+
+	return dependencies
+
+# end of StageDependencies()
+
+###############################################################################
+# StartStage - start the command of a stage.
+#	The stderr of the command is collected in a temporary file, so the
+#	messages of stages running at the same time are not mixed.
+# Returns: [process, stderr file, start time]
+###############################################################################
+
+def StartStage(stage):
+
+	args = [sys.executable, stage.Script()] + stage.command[1:]
+	errfile = tempfile.TemporaryFile()
+	if (stage.stdout):
+		with open(stage.stdout, 'w') as outfile:
+			process = subprocess.Popen(args, stdout=outfile, stderr=errfile)
+	else:
+		process = subprocess.Popen(args, stderr=errfile)
+
+	return [process, errfile, time.time()]
+
+# end of StartStage()
+
+###############################################################################
+# FinishStage - log the command line, the stderr and the time of a stage
+#	that has finished.
+# Returns: True if the command succeeded
+###############################################################################
+
+def FinishStage(stage, running):
+
+	process, errfile, start = running
+	status = process.returncode
+
+	sys.stderr.write(" \n")
+	sys.stderr.write("%s\n"%(stage.description))
+	sys.stderr.write("### %s\n \n"%(stage.CommandLine()))
+	errfile.seek(0)
+	for line in errfile:
+		sys.stderr.write(line)
+	errfile.close()
+	sys.stderr.write("### [%s] finished in %.1f seconds (status %d)\n"%(stage.name, time.time() - start, status))
+
+	return (status == 0)
+
+# end of FinishStage()
+
+###############################################################################
+# RunPipeline - run the stages whose outputs are not up to date.
+#	Up to n_jobs stages run at the same time.  A stage is started when
+#	the stages it depends on are done.  After a stage fails, no more stages
+#	are started.
+#	In a dry run, the outputs of the stages that would run are pending, and
+#	the stages that read them would run too, without hashing their inputs.
+# Returns: True if all the stages succeeded
+###############################################################################
+
+def RunPipeline(stages, cache_filename, force=False, dry_run=False, n_jobs=1):
+
+	cache = {"files": {}, "stages": {}}
+	if (os.path.exists(cache_filename)):
+		with open(cache_filename, 'r') as infile:
+			cache = json.load(infile)
+	hasher = FileHasher(cache["files"])
+
+	pending = OrderStages(stages)
+	dependencies = StageDependencies(pending)
+	done = set()
+	running = {}		# stage name to [stage, key, [process, stderr file, start time]]
+	would_write = set()	# outputs of the stages that would run, in a dry run
+
+	n_run = 0
+	n_skipped = 0
+	ok = True
+	start = time.time()
+	while (len(pending) > 0) or (len(running) > 0):
+
+		# start the stages that are ready, in the order of the dependencies
+		for stage in list(pending):
+			if (not ok) or (len(running) >= n_jobs):
+				break
+			if (not dependencies[stage.name] <= done):
+				continue
+			pending.remove(stage)
+
+			if (dry_run) and (would_write.intersection(stage.inputs)):
+				n_run += 1
+				sys.stderr.write("### [%s] would run (after its inputs are written): %s\n"%(stage.name, stage.CommandLine()))
+				would_write.update(stage.outputs)
+				done.add(stage.name)
+				continue
+
+			key = StageKey(stage, hasher)
+			if (key == None):
+				ok = False
+				break
+
+			saved = cache["stages"].get(stage.name)
+			if (not force) and (saved) and (saved["key"] == key):
+				current = dict([(f, hasher.Hash(f)) for f in stage.outputs])
+				if (current == saved["outputs"]):
+					sys.stderr.write("### [%s] is up to date\n"%(stage.name))
+					n_skipped += 1
+					done.add(stage.name)
+					continue
+
+			n_run += 1
+			if (dry_run):
+				sys.stderr.write("### [%s] would run: %s\n"%(stage.name, stage.CommandLine()))
+				would_write.update(stage.outputs)
+				done.add(stage.name)
+				continue
+
+			# forget the stage until it succeeds
+			cache["stages"].pop(stage.name, None)
+			sys.stderr.write("### [%s] started\n"%(stage.name))
+			running[stage.name] = [stage, key, StartStage(stage)]
+
+		if (len(running) == 0):
+			break
+
+		# wait for a stage to finish
+		finished = [name for name in running if running[name][2][0].poll() != None]
+		if (len(finished) == 0):
+			time.sleep(0.05)
+			continue
+		for name in finished:
+			stage, key, run = running.pop(name)
+			if FinishStage(stage, run):
+				cache["stages"][stage.name] = {"key": key, "outputs": dict([(f, hasher.Hash(f)) for f in stage.outputs])}
+				done.add(stage.name)
+			else:
+				ok = False
+
+	if (not dry_run):
+		with open(cache_filename, 'w') as outfile:
+			json.dump(cache, outfile, indent=1, sort_keys=True)
+
+	sys.stderr.write(" \n")
+	sys.stderr.write("# Stages run:        %d\n"%n_run)
+	sys.stderr.write("# Stages up to date: %d\n"%n_skipped)
+	sys.stderr.write("# Elapsed seconds:   %.1f\n"%(time.time() - start))
+	return ok
+
+# end of RunPipeline()
+
+###############################################################################
+# CountStages - stages of NTM_build_data_counts.sh for a source file
+###############################################################################
+
+def CountStages(out_dir, label, source, options):
+
+	def Out(name):
+		return os.path.join(out_dir, "%s_%s.csv"%(label, name))
+
+	rapid_slow = [("ANY", Out("ANY_RAPID_SLOW")), ("OTHER", Out("OTHER_THAN_RAPID_SLOW")),
+		("1", Out("RAPID")), ("2", Out("SLOW"))]
+	individual = [("ANY", Out("ANY_INDIVIDUAL")), ("OTHER", Out("OTHER_THAN_INDIVIDUAL"))]
+	for i, species in enumerate(INDIVIDUAL_SPECIES):
+		individual.append(("%d"%(i+1), Out(species)))
+
+	stages = []
+	for cat_name, cat_filename, outputs in [("rapid_slow", "RAPID_SLOW_CATEGORIES.txt", rapid_slow),
+											("individual", "INDIVIDUAL_CATEGORIES.txt", individual)]:
+		command = ["NTM_ZCTA_category_counts.py"] + options + ["-C", cat_filename]
+		for cat, filename in outputs:
+			command += ["-w", "%s=%s"%(cat, filename)]
+		command.append(source)
+		stages.append(Stage("counts_%s_%s"%(label, cat_name),
+			"Creating ZCTA counts for the categories in %s [%s]"%(cat_filename, source),
+			command, [source, cat_filename, ZCTA_TABLE, ZCTA_INDEX], [f for c, f in outputs]))
+
+	return stages
+
+# end of CountStages()
+
+###############################################################################
+# AttrStages - stages of NTM_build_data_attr.sh for a source file
+###############################################################################
+
+def AttrStages(out_dir, label, source):
+
+	command = ["NTM_ZCTA_category_aggregate.py", "-h", "-C", "RAPID_SLOW_CATEGORIES.txt"]
+	outputs = []
+	for kind in ["data", "attr"]:
+		for name, category in [("any", "ANY"), ("rapid", "1"), ("slow", "2")]:
+			filename = os.path.join(out_dir, "%s_%s_%s.csv"%(label, name, kind))
+			command += ["-w", "%s:%s=%s"%(kind, category, filename)]
+			outputs.append(filename)
+	command.append(source)
+
+	return [Stage("attr_%s"%(label),
+		"Generate the case data and attributes for species in each category for each ZCTA [%s]"%(source),
+		command, [source, "RAPID_SLOW_CATEGORIES.txt", ZCTA_TABLE, ZCTA_INDEX], outputs)]
+
+# end of AttrStages()
+
+###############################################################################
+# DatasetStages - stages of NTM_build_datasets.sh
+#	states is the list of states with their own data sets
+#	The record files passed between the stages are named with compress_ext
+#	(e.g. ".gz"), to write them compressed (see NTM_compress.py).
+###############################################################################
+
+def DatasetStages(out_dir, input_file, cf_ids, states, compress_ext=""):
+
+	def Out(name):
+		return os.path.join(out_dir, name)
+
+	def Records(name):
+		return os.path.join(out_dir, name + compress_ext)
+
+	stages = [
+		Stage("split_cf", "Splitting the input file [%s] into CF and NON-CF patient records"%(input_file),
+			["NTM_Split_CF_patients.py", "-c", cf_ids, "-R", Records(NON_CF_PATIENTS), "-M", Records(CF_PATIENTS), input_file],
+			[input_file, cf_ids], [Records(NON_CF_PATIENTS), Records(CF_PATIENTS)]),
+		Stage("summary_non_cf", "Creating summary of [%s]"%(Records(NON_CF_PATIENTS)),
+			["NTM_species_summary.py", "-s", "-m", Records(NON_CF_PATIENTS)],
+			[Records(NON_CF_PATIENTS)], stdout=Out("NON_CF_" + SUMMARY)),
+		Stage("summary_cf", "Creating summary of [%s]"%(Records(CF_PATIENTS)),
+			["NTM_species_summary.py", "-s", "-m", Records(CF_PATIENTS)],
+			[Records(CF_PATIENTS)], stdout=Out("CF_" + SUMMARY)),
+		Stage("diagnosed", "Creating list of species found for each patient [%s]"%(Records(NON_CF_PATIENTS)),
+			["NTM_species_per_patient.py", "-r", "-O", Records(DIAGNOSED), Records(NON_CF_PATIENTS)],
+			[Records(NON_CF_PATIENTS)], [Records(DIAGNOSED)]),
+		Stage("undiagnosed", "Creating list of both diagnosed and undiagnosed patients [%s]"%(Records(NON_CF_PATIENTS)),
+			["NTM_species_per_patient.py", "-r", "-u", "-O", Records(UNDIAGNOSED), Records(NON_CF_PATIENTS)],
+			[Records(NON_CF_PATIENTS)], [Records(UNDIAGNOSED)]),
+		Stage("state_filter", "Creating lists of diagnosed patients for states %s [%s]"%(",".join(states), Records(DIAGNOSED)),
+			["NTM_state_filter.py", "-s", ",".join(states), "-o", Records(STATE_DIAGNOSED), Records(DIAGNOSED)],
+			[Records(DIAGNOSED)], [Records(STATE_DIAGNOSED%(s)) for s in states]),
+		Stage("zcta_index", "Compiling the index of the ZIP to ZCTA table [%s]"%(ZCTA_TABLE),
+			["NTM_zcta.py", "-Z", ZCTA_TABLE],
+			[ZCTA_TABLE], [ZCTA_INDEX]),
+	]
+
+	stages += CountStages(out_dir, "NonCF_ALL", Records(DIAGNOSED), ["-h"])
+	stages += CountStages(out_dir, "NonCF_ALL_W_STATE", Records(DIAGNOSED), ["-h", "-s"])
+	for s in states:
+		stages += CountStages(out_dir, "NonCF_%s"%(s), Records(STATE_DIAGNOSED%(s)), ["-h"])
+
+	stages.append(Stage("combined_ALL", "Creating combined list of species diagnosed for each patient",
+		["NTM_combined_patient_species.py", "-1", "-h", Records(DIAGNOSED)],
+		[Records(DIAGNOSED), ZCTA_TABLE, ZCTA_INDEX], stdout=Out("NonCF_ALL_" + PATIENT_SPECIES)))
+	for s in states:
+		stages.append(Stage("combined_%s"%(s), "Creating combined list of species diagnosed for each %s patient"%(s),
+			["NTM_combined_patient_species.py", "-1", "-h", Records(STATE_DIAGNOSED%(s))],
+			[Records(STATE_DIAGNOSED%(s)), ZCTA_TABLE, ZCTA_INDEX], stdout=Out("NonCF_%s_%s"%(s, PATIENT_SPECIES))))
+
+	stages += AttrStages(out_dir, "NonCF_ALL", Records(DIAGNOSED))
+	for s in states:
+		stages += AttrStages(out_dir, "NonCF_%s"%(s), Records(STATE_DIAGNOSED%(s)))
+
+	return stages
+
+# end of DatasetStages()
+
+###############################################################################
+#
+# Main application processing
+#
+###############################################################################
+
+def Main():
+
+	input_file = INPUT_FILE
+	cf_ids = CF_PATIENT_IDS
+	states = ["CO"]
+	force = False
+	dry_run = False
+	n_jobs = 1
+	compress_ext = ""
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "c:fi:j:ns:z:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-i':			input_file = value
+		elif opt == '-c':			cf_ids = value
+		elif opt == '-s':			states = [s.strip().upper() for s in value.split(',')]
+		elif opt == '-f':			force = True
+		elif opt == '-n':			dry_run = True
+		elif opt == '-j':			n_jobs = max(1, int(value))
+		elif opt == '-z':			compress_ext = value
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	out_dir = "Results"
+	if (len(args) > 0):
+		out_dir = args[0]
+	if (not os.path.isdir(out_dir)):
+		os.makedirs(out_dir)
+
+	if (compress_ext) and (not compress_ext.startswith(".")):
+		compress_ext = "." + compress_ext
+	if (compress_ext) and (NTM_compress.FormatOfName(compress_ext) == None):
+		sys.stderr.write("\nError: unknown compression [%s], must be .gz, .bz2, .xz or .zst\n"%(compress_ext))
+		exit(-1)
+
+	stages = DatasetStages(out_dir, input_file, cf_ids, states, compress_ext)
+	if not RunPipeline(stages, os.path.join(out_dir, CACHE_FILENAME), force, dry_run, n_jobs):
+		exit(-1)
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	Main()
+
+###############################################################################
+###############################################################################
@@ -0,0 +1,229 @@
+# Reading the records of NTM patient data files
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The source data files are read one line at a time, so the memory used
+#	does not grow with the size of the file.  The records for each patient
+#	are expected to be on consecutive lines of the file.
+#
+#	Records can also be read from and written to compressed files (.gz,
+#	.bz2, .xz, .zst), see NTM_compress.py.
+#
+#	Records are written by a RecordWriter, which joins the lines of many
+#	records for each write, to files (and stdout, see BufferedStdout) with
+#	buffers of OUTPUT_BUFFER_SIZE bytes.  When the environment variable
+#	NTM_FLUSH_SECONDS is set, the records written are also flushed after
+#	that many seconds, for watching the progress of a run (e.g. tail -f).
+#
+
+import string
+import sys, os, re
+import csv
+import atexit, time
+import NTM_metrics
+import NTM_compress
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+FLUSH_SECONDS_VARIABLE = "NTM_FLUSH_SECONDS"
+
+###############################################################################
+# SplitLine - splits the columns of a record at each comma
+###############################################################################
+def SplitLine(line):
+	return line.split(',')
+# end of SplitLine()
+
+###############################################################################
+# SplitQuotedLine - splits the columns of a record at each comma that is not
+#	inside double quotes.  The quotes around a column are removed, as by
+#	the csv module.  Lines without quotes are split at each comma.
+###############################################################################
+def SplitQuotedLine(line):
+	if ('"' not in line):
+		return line.split(',')
+	return csv.reader([line]).next()
+# end of SplitQuotedLine()
+
+###############################################################################
+# RecordReader - reads the records from an open file, one line at a time.
+#
+#	Iterating over the reader yields the list of columns for each record.
+#	Iterating over reader.Patients() yields the list of records for each
+#	patient (consecutive records with the same id in the first column).
+#
+#	Lines shorter than 2 characters are skipped.  Each record is converted
+#	to upper case before being split into columns.
+#
+#	Options:
+#		split_cols		function used to split a line into columns
+#		skip_comments	skip lines starting with '#'
+#		line_numbers	append the line number to the columns of each record
+#		report_skipped	write a message to stderr for each line skipped
+#
+#	After reading, line_no is the number of lines read (including skipped
+#	lines) and n_records is the number of records returned.
+###############################################################################
+class RecordReader(object):
+
+	def __init__(self, fh, split_cols=SplitLine, skip_comments=False, line_numbers=False, report_skipped=False):
+		self.fh = fh
+		self.split_cols = split_cols
+		self.skip_comments = skip_comments
+		self.line_numbers = line_numbers
+		self.report_skipped = report_skipped
+
+		self.line_no = 0
+		self.n_records = 0
+
+	def __iter__(self):
+		# the time of reading and splitting the lines is added to the run metrics
+		metrics = NTM_metrics.current
+		timed = metrics.enabled
+		if (timed):		metrics.Switch("read")
+
+		for line in self.fh:
+			if (timed):		metrics.Switch("parse")
+			self.line_no += 1
+			line = line.strip()
+			if (len(line) < 2):
+				if (self.report_skipped):
+					sys.stderr.write("skipping line: [%s]\n"%line)
+				continue
+			if (self.skip_comments and line[0] == '#'):
+				continue
+
+			self.n_records += 1
+			line = line.upper()
+			cols = self.split_cols(line)
+			if (self.line_numbers):
+				cols.append(self.line_no)
+			yield cols
+			if (timed):		metrics.Switch("read")
+
+		metrics.Count("rows", self.line_no)
+
+	def Patients(self):
+		current_patient = None
+		records = []
+		n_patients = 0
+
+		for cols in self:
+			if cols[0] != current_patient:
+				if (len(records) > 0):
+					n_patients += 1
+					yield records
+				records = []
+				current_patient = cols[0]
+			records.append(cols)
+
+		# the last patient records
+		if (len(records) > 0):
+			n_patients += 1
+			yield records
+
+		NTM_metrics.current.Count("patients", n_patients)
+
+# end of RecordReader
+
+###############################################################################
+# FlushSeconds - the interval for flushing the output, from NTM_FLUSH_SECONDS
+# Returns: seconds, or None to flush only when the buffer is full
+###############################################################################
+
+def FlushSeconds():
+
+	value = os.environ.get(FLUSH_SECONDS_VARIABLE)
+	if (not value):
+		return None
+	return float(value)
+
+# end of FlushSeconds()
+
+###############################################################################
+# BufferedStdout - reopen stdout with a buffer of OUTPUT_BUFFER_SIZE bytes,
+#	which is flushed when the script exits.
+###############################################################################
+
+def BufferedStdout():
+
+	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', OUTPUT_BUFFER_SIZE)
+	atexit.register(sys.stdout.flush)
+	return sys.stdout
+
+# end of BufferedStdout()
+
+###############################################################################
+# RecordWriter - writes records to an open file as CSV text.
+#
+#	The lines of the records are collected and written with a single join
+#	for each RECORDS_PER_WRITE records.  The file is flushed by Flush and
+#	Close, and every flush_seconds (default: FlushSeconds()).
+###############################################################################
+
+RECORDS_PER_WRITE = 1000
+
+class RecordWriter(object):
+
+	def __init__(self, fh, flush_seconds=None):
+		self.fh = fh
+		self.lines = []
+		if (flush_seconds == None):
+			flush_seconds = FlushSeconds()
+		self.flush_seconds = flush_seconds
+		self.last_flush = time.time()
+
+	def Write(self, cols):
+		self.WriteLine(",".join(cols))
+
+	def WriteLine(self, line):
+		lines = self.lines
+		lines.append(line)
+		if (len(lines) >= RECORDS_PER_WRITE):
+			self.WritePending()
+		if (self.flush_seconds != None) and (time.time() - self.last_flush >= self.flush_seconds):
+			self.Flush()
+
+	# write the collected lines to the file
+	def WritePending(self):
+		if (len(self.lines) > 0):
+			self.lines.append("")
+			self.fh.write("\n".join(self.lines))
+			self.lines = []
+
+	def Flush(self):
+		self.WritePending()
+		self.fh.flush()
+		self.last_flush = time.time()
+
+	def Close(self):
+		self.Flush()
+		if (self.fh != sys.stdout):
+			self.fh.close()
+
+# end of RecordWriter
+
+###############################################################################
+# OpenRecords - open a reader for the records of the named file.
+#	The options are the options of RecordReader.
+###############################################################################
+
+def OpenRecords(filename, **options):
+
+	return RecordReader(NTM_compress.OpenInput(filename), **options)
+
+# end of OpenRecords()
+
+###############################################################################
+# OpenWriter - open a writer for records to the named file.
+#	If filename is None, the records are written to stdout.
+###############################################################################
+
+def OpenWriter(filename):
+
+	if (filename == None):
+		return RecordWriter(sys.stdout)
+
+	return RecordWriter(NTM_compress.OpenOutput(filename, OUTPUT_BUFFER_SIZE))
+
+# end of OpenWriter()
@@ -7,7 +7,13 @@
 
 import string
 import sys, os, re, getopt
+import itertools, multiprocessing
+import cStringIO
+import NTM_extract_data
 from NTM_extract_data import * 
+from NTM_read_data import OpenRecords, OpenWriter, SplitQuotedLine, BufferedStdout
+import NTM_metrics
+import NTM_diagnostics
 
 ###############################################################################
 #
@@ -19,6 +25,9 @@ def Usage():
 	sys.stderr.write( '\t Options:\n')
 	sys.stderr.write( '\t     -r    only output recognized methods')
 	sys.stderr.write( '\t     -u    output record for undiagnosed patients\n')
+	sys.stderr.write( '\t     -j <n>  number of processes used to extract the patient records [default: 1]\n')
+	sys.stderr.write( '\t     -d    write the records processed to debug_extracted.csv and debug_ignored.csv\n')
+	sys.stderr.write( '\t     -O <filename>  write the records to filename instead of stdout\n')
 	sys.stderr.write( '\n\n')
 # end of Usage()
 
@@ -27,9 +36,13 @@ def Usage():
 # 	Process the records given, combining the information into a single output
 #	record.  Check the records to see if there were RAPID or SLOW growing 
 #	species diagnosed.  Add a column with the correct ZCTA for given zip code.
+#	Only recognized methods are output if only_recognised_method is set,
+#	and a record is output for an undiagnosed patient if undiagnosed_patients
+#	is set.
+# Returns: (patient id, dict of species, list of output lines)
 ###############################################################################
 
-def ProcessRecords(records):
+def PatientSpecies(records, only_recognised_method, undiagnosed_patients):
 #OLD				NEW
 #   9 J Current Age		-> 15
 #   10 K Gender of Subject	-> 16
@@ -40,26 +53,27 @@ def ProcessRecords(records):
 #   15 P ZIP			->  5
 #   16 Q Marital Status		->  6
 	DATE = 7
-	global only_recognised_method
-	global undiagnosed_patients
 
 	#Create dictionary for species identification
 	#   Key: species, Value: [[list of methods],[list of line no]] 
 	#
 	patient_species = {}
+	output_lines = []
 
 	if len(records) == 0:
-		return patient_species
+		return (None, patient_species, output_lines)
 		
 #	sys.stderr.write("\tRecords:\n", len(records), records
 	patient_id = records[0][0]
 #	sys.stderr.write("Processing patient id: %s (%d)\n"%(patient_id,len(records)))
 	
 	record_date = "no date"
+	diagnostics = NTM_diagnostics.current
 
 	for rec in records:
 		if (len(rec) <= DATE): 
-			sys.stderr.write("Skipping record [%d] for patient id [%s], because no date field available.\n"%(rec[-1],rec[0]))
+			diagnostics.Report("skipping record no date", (rec[0],rec[-1]),
+				"Skipping record [%d] for patient id [%s], because no date field available.\n", rec[-1],rec[0])
 			continue
 		record_date = rec[DATE]
 		rec_species,rec_methods = ExtractData(rec, only_recognised_method)
@@ -67,8 +81,8 @@ def ProcessRecords(records):
 		if (len(rec_methods) == 0):		# skip records that do not contain both a species and a method
 			if (len(rec_species) > 0):
 				# report the skipping of patient record
-				sys.stderr.write("Skipping record [%d] for patient id [%s], because no method indicated.\n"%(rec[-1],rec[0]))
-				sys.stderr.write("\t[%s][%s]\n"%(rec[8],rec[9]))
+				diagnostics.Report("skipping record no method", (rec[0],rec[-1]),
+					"Skipping record [%d] for patient id [%s], because no method indicated.\n\t[%s][%s]\n", rec[-1],rec[0],rec[8],rec[9])
 				
 			continue
 			
@@ -93,7 +107,8 @@ def ProcessRecords(records):
 		age_str = rec[15]
 		age = int(age_str)
 	except:
-		sys.stderr.write("[%d] for patient id [%s], bad age [%s].\n"%(rec[-1],rec[0], age_str))
+		diagnostics.Report("bad age", (rec[0],rec[-1]),
+			"[%d] for patient id [%s], bad age [%s].\n", rec[-1],rec[0], age_str)
 
 	try:
 		patient_data =  ", " + ', '.join([rec[15], rec[16], rec[17], rec[3], rec[4], rec[5], rec[6]])
@@ -103,16 +118,111 @@ def ProcessRecords(records):
 	if (len(patient_species) == 0):
 		# undiagnosed patient
 		if (undiagnosed_patients):
-			print ', '.join([patient_id, record_date, "", ""]), patient_data
+			output_lines.append(', '.join([patient_id, record_date, "", ""]) + " " + patient_data)
 	else:
 		for s in patient_species:
 			for m in patient_species[s][0]:
-				print ', '.join([patient_id, record_date, s, m]), patient_data
+				output_lines.append(', '.join([patient_id, record_date, s, m]) + " " + patient_data)
 						
-	return patient_species
+	return (patient_id, patient_species, output_lines)
 	
+#end of PatientSpecies
+
+###############################################################################
+# 	Process the records given for a patient, with the options of the run.
+# Returns: (patient id, dict of species, list of output lines)
+###############################################################################
+
+def ProcessRecords(records):
+
+	global only_recognised_method
+	global undiagnosed_patients
+
+	NTM_metrics.current.Switch("extract")
+	return PatientSpecies(records, only_recognised_method, undiagnosed_patients)
+
 #end of ProcessRecords
 
+###############################################################################
+# 	Initialize a worker process of the pool used to extract patient records.
+###############################################################################
+
+def InitWorker(recognised_method, undiagnosed, debug):
+	global only_recognised_method
+	global undiagnosed_patients
+
+	only_recognised_method = recognised_method
+	undiagnosed_patients = undiagnosed
+
+	# the debug records are returned to the main process, which writes them in input order
+	NTM_extract_data.debug_extracted = None
+	NTM_extract_data.debug_ignored = None
+	if (debug):
+		NTM_extract_data.debug_extracted = cStringIO.StringIO()
+		NTM_extract_data.debug_ignored = cStringIO.StringIO()
+
+# end of InitWorker()
+
+###############################################################################
+# 	Process the records of a patient in a worker process.
+# Returns: (result of ProcessRecords, debug extracted text, debug ignored text,
+#	diagnostics of the records or None)
+###############################################################################
+
+def WorkerProcessRecords(records):
+
+	result = ProcessRecords(records)
+	
+	extracted = None
+	ignored = None
+	if (NTM_extract_data.debug_extracted != None):
+		extracted = NTM_extract_data.debug_extracted.getvalue()
+		ignored = NTM_extract_data.debug_ignored.getvalue()
+		NTM_extract_data.debug_extracted.truncate(0)
+		NTM_extract_data.debug_ignored.truncate(0)
+
+	diagnostics = None
+	if (len(NTM_diagnostics.current.events) > 0):
+		diagnostics = NTM_diagnostics.current.Take()
+
+	return (result, extracted, ignored, diagnostics)
+
+# end of WorkerProcessRecords()
+
+###############################################################################
+# 	Process the patients on a pool of worker processes.  The patients are
+#	sent to the pool in batches, while the results of the previous batch are
+#	returned.  Returns the results of ProcessRecords in input order.
+###############################################################################
+
+PATIENTS_PER_BATCH = 2000
+
+def ParallelProcessRecords(pool, patients, n_jobs):
+
+	chunk_size = max(1, PATIENTS_PER_BATCH / (4 * n_jobs))
+
+	pending = None
+	while True:
+		batch = list(itertools.islice(patients, PATIENTS_PER_BATCH))
+		
+		submitted = None
+		if (len(batch) > 0):
+			submitted = pool.map_async(WorkerProcessRecords, batch, chunk_size)
+		
+		if (pending != None):
+			NTM_metrics.current.Switch("extract")		# waiting for the workers
+			for result, extracted, ignored, diagnostics in pending.get():
+				if (extracted):		NTM_extract_data.debug_extracted.write(extracted)
+				if (ignored):		NTM_extract_data.debug_ignored.write(ignored)
+				if (diagnostics):	NTM_diagnostics.current.Merge(diagnostics)
+				yield result
+				
+		if (submitted == None):
+			break
+		pending = submitted
+
+# end of ParallelProcessRecords()
+
 
 ###############################################################################
 #
@@ -126,12 +236,17 @@ def Main():
 	global separate_patients
 	global undiagnosed_patients
 	
+	metrics = NTM_metrics.StartMetrics()
+
 	only_recognised_method = False
 	separate_patients = True
 	undiagnosed_patients = False
+	n_jobs = 1
+	debug = False
+	output_filename = None
 	
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "ru", ["help"])
+		opts, args = getopt.getopt(sys.argv[1:], "dj:O:ru", ["help"])
 	except getopt.GetoptError:
 		Usage()
 		sys.exit(1)
@@ -140,6 +255,9 @@ def Main():
 		#print opt, value
 		if	 opt == '-r':		only_recognised_method = True
 		elif opt == '-u':		undiagnosed_patients = True
+		elif opt == '-j':		n_jobs = int(value)
+		elif opt == '-d':		debug = True
+		elif opt == '-O':		output_filename = value
 		else: 
 			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
 
@@ -148,67 +266,41 @@ def Main():
 		exit(-1)
 
 	# open a filename given on the command line.
-	fh=open(args[0])
+	reader = OpenRecords(args[0], split_cols=SplitQuotedLine, line_numbers=True, report_skipped=True)
+
+	if (debug):
+		OpenDebugFiles()
+
+	output = OpenWriter(output_filename)
 
 	n_patients = 0
 	n_missing = 0
 	n_diagnosed = 0
 	n_written = 0
 
-	line_no = 0
-	current_patient = ""
-	records = []
 	patients = {}
 	undiagnosed = {}
 		
-	for line in fh.readlines():
-		line_no += 1
-		line = line.strip()		
-		if (len(line) < 2):
-			sys.stderr.write("skipping line: [%s]\n"%line)
-			continue
-
-		line = line.upper()
-		cols = line.split(',')
-
-		patients[cols[0]] = 1
-		
-	#	print cols[0], "[%s, %s]"%(cols[2],cols[3])
+	# for each set of records for a patient
+	#		collect counts of each category of species
+	#		write new record with counts
 
-		# for each set of records for a patient
-		#		collect counts of each category of species
-		#		write new record with counts
+	pool = None
+	if (n_jobs > 1):
+		pool = multiprocessing.Pool(n_jobs, InitWorker, (only_recognised_method, undiagnosed_patients, debug))
+		results = ParallelProcessRecords(pool, reader.Patients(), n_jobs)
+	else:
+		results = itertools.imap(ProcessRecords, reader.Patients())
 
-		if cols[0] != current_patient:
-			if (len(records) > 0): 
-				n_patients += 1
-				
-#				if (separate_patients):
-#					print	# separate patients
-				patient_species = ProcessRecords(records)
-			
-				if (len(patient_species) == 0):
-					n_missing += 1
-					undiagnosed[current_patient] = 1
-				else:
-					# count number of records written
-					for s in patient_species:			
-						n_written += len(patient_species[s][0])	# count number of methods for species
-					n_diagnosed += 1
-					
-			records = []
-			current_patient = cols[0]
-
-		cols.append(line_no)
-		records.append(cols)	
-	
-	# process the last patient records
-	if (len(records) > 0): 
+	for current_patient, patient_species, output_lines in results:
+		metrics.Switch("write")
+		patients[current_patient] = 1
 		n_patients += 1
 		
 #		if (separate_patients):
 #			print	# separate patients
-		patient_species = ProcessRecords(records)
+		for line in output_lines:
+			output.WriteLine(line)
 	
 		if (len(patient_species) == 0):
 			n_missing += 1
@@ -219,6 +311,16 @@ def Main():
 				n_written += len(patient_species[s][0])	# count number of methods for species
 			n_diagnosed += 1
 
+	if (pool != None):
+		pool.close()
+		pool.join()
+
+	metrics.Switch("write")
+	output.Close()
+	CloseDebugFiles()
+
+	line_no = reader.line_no
+
 	# Print the summary information
 
 	sys.stderr.write("\n")
@@ -237,8 +339,8 @@ def Main():
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	
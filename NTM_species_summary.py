@@ -8,6 +8,8 @@
 import string
 import sys, os, re, getopt
 from NTM_extract_data import * 
+from NTM_read_data import OpenRecords, SplitQuotedLine, BufferedStdout
+from NTM_metrics import StartMetrics
 
 ###############################################################################
 #
@@ -20,17 +22,10 @@ def Usage():
 	print '\t     -m    print summary of methods extracted'
 	print '\t     -s    print summary of species extracted'
 	print '\t     -u    print summary of patients without MYCOBACTERIUM diagnosis'
+	print '\t     -d    write the records processed to debug_extracted.csv and debug_ignored.csv'
 	print '\n'
 # end of Usage()
 
-###############################################################################
-# SplitCols - splits columns but takes quotes into account
-###############################################################################
-PATTERN = re.compile(r'''((?:[^,"']|"[^"]*"|'[^']*')+)''')
-def SplitCols(line):
-	return PATTERN.split(line)[1::2]
-#end SplitCols
-
 ###############################################################################
 # 	Process the records given, combining the information into a single output
 #	record.  Check the records to see if there were RAPID or SLOW growing 
@@ -97,14 +92,17 @@ def Main():
 	global display_methods
 	global only_recognised_method
 	
+	metrics = StartMetrics()
+
 	display_species = False
 	display_methods = False
 	display_undiagnosed = False
 
 	only_recognised_method = False
+	debug = False
 	
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "msu", ["help"])
+		opts, args = getopt.getopt(sys.argv[1:], "dmsu", ["help"])
 	except getopt.GetoptError:
 		Usage()
 		sys.exit(1)
@@ -114,6 +112,7 @@ def Main():
 		if	 opt == '-m':			display_methods = True
 		elif opt == '-s':			display_species = True
 		elif opt == '-u':			display_undiagnosed = True
+		elif opt == '-d':			debug = True
 		else: 
 			print "Unhandled opt [%s][%s]"%(opt,value)
 
@@ -130,71 +129,30 @@ def Main():
 	total_methods = {}
 
 	# open a filename given on the command line.
-	fh=open(args[0])
+	reader = OpenRecords(args[0], split_cols=SplitQuotedLine, line_numbers=True)
+
+	if (debug):
+		OpenDebugFiles()
 
 	n_patients = 0
 	n_missing = 0
 	n_diagnosed = 0
 
-	line_no = 0
-	current_patient = ""
-	records = []
 	patients = {}
 	undiagnosed = {}
 		
-	for line in fh.readlines():
-		line_no += 1
-		line = line.strip()		
-		if (len(line) < 2):
-			continue
-
-		line = line.upper()
-		cols = SplitCols(line)  #line.split(',')
-
-		patients[cols[0]] = 1
-		
-	#	print cols[0], "[%s, %s]"%(cols[2],cols[3])
-
-		# for each set of records for a patient
-		#		collect counts of each category of species
-		#		write new record with counts
-
-		if cols[0] != current_patient:
-			if (len(records) > 0): 
-				n_patients += 1
-				
-				patient_species,patient_methods = ProcessRecords(records)
-			
-				if (len(patient_species) == 0):
-					n_missing += 1
-					undiagnosed[current_patient] = 1
-				else:
-					n_diagnosed += 1
-					
-				for s in patient_species:
-					if (s in total_species):
-						total_species[s].extend(patient_species[s])
-					else:
-						total_species[s] = patient_species[s]
-			
-				# add in the results to the global list of methods
-				for m in patient_methods:
-					if (m in total_methods):
-						total_methods[m].extend(patient_methods[m])
-					else:
-						total_methods[m] = patient_methods[m]
-			
-			records = []
-			current_patient = cols[0]
-
-		cols.append(line_no)
-		records.append(cols)	
-	
-	# process the last patient records
-	if (len(records) > 0): 
+	# for each set of records for a patient
+	#		collect counts of each category of species
+	#		write new record with counts
+
+	for records in reader.Patients():
+		metrics.Switch("extract")
+		current_patient = records[0][0]
+		patients[current_patient] = 1
 		n_patients += 1
 		
 		patient_species,patient_methods = ProcessRecords(records)		
+		metrics.Switch("aggregate")
 
 		# add in the results to the global list of species
 		if (len(patient_species) == 0):
@@ -216,6 +174,10 @@ def Main():
 			else:
 				total_methods[m] = patient_methods[m]
 
+	line_no = reader.line_no
+	metrics.Switch("write")
+	CloseDebugFiles()
+
 	# Print the summary information
 
 	if (display_species):
@@ -270,8 +232,8 @@ def Main():
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	
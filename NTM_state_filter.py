@@ -21,19 +21,70 @@
 
 import string
 import sys, re, os, getopt
+from NTM_read_data import OpenRecords, OpenWriter, BufferedStdout
+import NTM_metrics
+import NTM_diagnostics
 
+# a state value that can be used in the name of an output file
+STATE_PATTERN = re.compile(r'^[A-Z]{2}$')
 
 ###############################################################################
 
 def Usage():
-	print 'Usage: %s -s <state> <source data> '%(re.sub('^.*/','',sys.argv[0]))
+	print 'Usage: %s -s <state> [-o <output pattern>] <source data> '%(re.sub('^.*/','',sys.argv[0]))
 	print '\t Filter data by given state.'
 	print '\t      -s <state>  filter out data with given state'
+	print '\t           May be a comma separated list of states, or "all" for every state found in the data.'
+	print '\t      -o <output pattern>  write the data of each state to a file named by the pattern,'
+	print '\t           with %s replaced by the state (e.g. %s_only_per_patient.csv).'
+	print '\t           Required with more than one state.'
 	print '\n'
 # end of Usage()
 
 ###############################################################################
+# 	Route each record to the output of its state in a single pass of the data.
+#	states is the set of states wanted, or None for all states.  The output
+#	file of each state wanted is written, even if it has no records.  With
+#	all states, the output file of a state is opened when its first record
+#	is found, and records with a state that is not a two letter code are
+#	not written.  Records with no state are not written.
+# Returns: dict of state to number of records written
+###############################################################################
+
+def SplitStates(reader, states, output_pattern):
+
+	outputs = {}
+	counts = {}
+	metrics = NTM_metrics.current
+
+	# truncate the outputs of the states wanted, so no output is left from an earlier run
+	if (states):
+		for state in states:
+			outputs[state] = OpenWriter(output_pattern%(state))
+			counts[state] = 0
+
+	for cols in reader:
+		metrics.Switch("write")
+		state = cols[8].strip()
+		if (state == "") or (states and state not in states):
+			continue
+		out = outputs.get(state)
+		if (not out):
+			if (not STATE_PATTERN.match(state)):
+				NTM_diagnostics.current.Report("invalid state", cols[0], "Skipping record [%s], invalid state [%s]\n", cols[0], state)
+				continue
+			out = OpenWriter(output_pattern%(state))
+			outputs[state] = out
+			counts[state] = 0
+		out.Write(cols)
+		counts[state] += 1
+
+	for out in outputs.values():
+		out.Close()
+
+	return counts
 
+# end of SplitStates()
 
 ###############################################################################
 #
@@ -43,58 +94,75 @@ def Usage():
 
 def Main():
 	
+	metrics = NTM_metrics.StartMetrics()
+
+	state = None
+	output_pattern = None
+
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "s:", ["help"])
+		opts, args = getopt.getopt(sys.argv[1:], "o:s:", ["help"])
 	except getopt.GetoptError:
 		Usage()
 		sys.exit(1)
 
 	for opt, value in opts:
 		#print opt, value
-		if opt == '-s':				state = value
-#		elif opt == '-o':			outfilename = value
+		if opt == '-s':				state = value.upper()
+		elif opt == '-o':			output_pattern = value
 		else: 
 			print "Unhandled opt [%s][%s]"%(opt,value)
 
-	if (len(args) < 1):
+	if (len(args) < 1) or (not state):
 		Usage()
 		exit(-1)	
 
+	if (state == "ALL"):
+		states = None
+	else:
+		states = set([s.strip() for s in state.split(',')])
+		for s in states:
+			if (not STATE_PATTERN.match(s)):
+				sys.stderr.write("\nError: invalid state [%s], must be a two letter code\n"%(s))
+				Usage()
+				exit(-1)
+	if (states == None) or (len(states) > 1) or (output_pattern):
+		if (not output_pattern) or (output_pattern.find('%s') < 0):
+			sys.stderr.write("\nError: output pattern with %%s required for state [%s]\n"%(state))
+			Usage()
+			exit(-1)
 	
 	# open a filename given on the command line.
-	fh=open(args[0])
-
-	line_no = 0
-
-	for line in fh.readlines():
-		line_no += 1
-
-		sline = line.strip()
-		if (len(sline) < 2):
-			continue
-		
-		sline = sline.upper()
-		cols = sline.split(',')
-		
-		cols[8] = cols[8].strip()
+	reader = OpenRecords(args[0])
+
+	if (output_pattern):
+		counts = SplitStates(reader, states, output_pattern)
+		for s in sorted(counts):
+			sys.stderr.write("%s: %d records [%s]\n"%(s, counts[s], output_pattern%(s)))
+		sys.stderr.write("processe %d lines\n"%reader.line_no)	
+		return
+
+	output = OpenWriter(None)
+	for cols in reader:
+		metrics.Switch("write")
 		#print "[%s] == [%s]"%(cols[8], state), cols[8] == state
 		#print cols[0], "[%s, %s]"%(cols[2],cols[3]), cols[8]
-		if cols[8] == state:
+		if cols[8].strip() == state:
 			#print cols[0], "[%s, %s]"%(cols[2],cols[3]), cols[8]
-			print sline
+			output.Write(cols)
+	output.Close()
 	
 		
 		
 		
-	sys.stderr.write("processe %d lines\n"%line_no)	
+	sys.stderr.write("processe %d lines\n"%reader.line_no)	
 
 ###############################################################################
 #
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	
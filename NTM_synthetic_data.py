@@ -0,0 +1,332 @@
+# Synthetic NTM lab export for testing and benchmarking the pipe line
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The real lab exports contain patient health information and cannot be
+#	shared, so this script writes a synthetic data set with the same layout.
+#	The data set is written to a directory, with the file names used by
+#	NTM_pipeline.py, so the pipe line can be run on it:
+#
+#		Lipner_NTM_CO_FINAL2.csv	lab records, in the 2018 column layout
+#		NTM_CF_patient_ids.csv		ids of the CF patients
+#		zipcodezctatable.txt		ZIP to ZCTA table
+#		RAPID_SLOW_CATEGORIES.txt	categories of the species
+#		INDIVIDUAL_CATEGORIES.txt
+#
+#	The diagnosis texts cover the cases handled by ExtractData: species and
+#	methods in the GENPROBE, IDENTIFICATION and HPLC columns, 'mycolic acid'
+#	phrases, NEGATIVE and UNABLE texts, multiple species separated by
+#	<COMMA>, and texts without a species.  ZIP codes have +4 suffixes,
+#	missing leading zeros, or are not in the ZCTA table.
+#
+#	The same seed and number of records always give the same data set.
+#
+#	Usage: python NTM_synthetic_data.py [options] <output_dir>
+#
+
+import string
+import sys, re, os, getopt
+import random
+from NTM_pipeline import INPUT_FILE, CF_PATIENT_IDS, ZCTA_TABLE, INDIVIDUAL_SPECIES
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# header of the 2018 lab export
+COLUMNS = ["PATIENT ID", "ACCESSION NUMBER", "SPECIMEN SOURCE", "CITY", "STATE", "ZIP", "MARITAL STATUS",
+	"COLLECTION DATE", "GENPROBE IDENTIFICATION TEXT RESULT", "IDENTIFICATION TEXT RESULT",
+	"HPLC IDENTIFICATION NO 1 TEXT RESULT", "HPLC IDENTIFICATION NO 2 TEXT RESULT",
+	"TEST CODE", "RESULT STATUS", "ORDERING FACILITY", "CURRENT AGE", "GENDER OF SUBJECT",
+	"RACE OF SUBJECT", "ETHNICITY OF SUBJECT"]
+
+GENPROBE = 8
+IDENT_TEXT = 9
+HPLC_1 = 10
+HPLC_2 = 11
+
+# (column of the diagnosis text, weight)
+DIAGNOSIS_COLUMNS = [(GENPROBE, 40), (IDENT_TEXT, 35), (HPLC_1, 10), (HPLC_2, 5), (None, 10)]
+
+# species names as they appear in the text, and the weight of each
+SPECIES = [("AVIUM COMPLEX", 30), ("AVIUM", 8), ("INTRACELLULARE", 10), ("ABSCESSUS GROUP", 8),
+	("ABSCESSUS", 6), ("CHIMAERA", 4), ("CHELONAE", 5), ("FORTUITUM", 6), ("SIMIAE", 2),
+	("GORDONAE", 8), ("KANSASII", 4), ("MASSILIENSE", 2), ("MUCOGENICUM", 4), ("PEREGRINUM", 1),
+	("XENOPI", 1), ("TUBERCULOSIS COMPLEX", 1)]
+
+METHODS = [("GENPROBE", 20), ("GEN PROBE", 5), ("RPOB", 10), ("16S", 10), ("MALDI-TOF", 15),
+	("BIOCHEMICALS", 8), ("BIOCHEMICAL", 2), ("HPLC", 8), ("CULTURE", 4), ("SEQUENCING", 3)]
+
+# templates of the diagnosis texts: %(s)s is a species, %(t)s a second species, %(m)s a method
+TEXTS = [
+	("MYCOBACTERIUM %(s)s IDENTIFIED BY %(m)s", 25),
+	("M. %(s)s IDENTIFIED BY %(m)s", 15),
+	("MYCOBACTERIUM %(s)s", 12),
+	("M %(s)s; CONFIRMED USING %(m)s", 6),
+	("M. %(s)s (BY %(m)s)", 4),
+	("ISOLATE IDENTIFIED AS M. %(s)s. IDENTIFICATION BY %(m)s.", 5),
+	("M. %(s)s<COMMA> M. %(t)s BY %(m)s", 3),
+	("MYCOLIC ACID PROFILE MOST CLOSELY RESEMBLES MYCOBACTERIUM AVIUM COMPLEX", 3),
+	("MYCOLIC ACID PROFILE MOST CLOSELY RESMBLES M. %(s)s", 1),
+	("MYCOLIC ACID PATTERN SEEN. M. %(s)s BY %(m)s", 2),
+	("NEGATIVE FOR MYCOBACTERIUM AVIUM COMPLEX BY GENPROBE", 6),
+	("NEGATIVE FOR ACID FAST BACILLI", 5),
+	("UNABLE TO IDENTIFY. REFERRED TO STATE LABORATORY", 4),
+	("NO GROWTH AFTER 6 WEEKS", 5),
+	("ACID FAST BACILLI SEEN; IDENTIFICATION TO FOLLOW", 3)]
+
+# (state, first 3 digits of the zip codes, number of zip codes)
+STATE_ZIPS = [("CO", range(800, 817), 400), ("FL", range(320, 350), 600), ("NJ", range(70, 90), 150),
+	("TX", range(750, 800), 200)]
+
+# weight of the states of the patients
+PATIENT_STATES = [("CO", 70), ("FL", 20), ("NJ", 5), ("TX", 5)]
+
+CF_FRACTION = 0.08
+RECORDS_PER_PATIENT = 6
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] <output_dir> \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t Writes a synthetic lab export, CF patient ids, ZIP to ZCTA table and category files.\n')
+	sys.stderr.write( '\t      -n <n>     number of lab records [default: 10000] (suffix K or M for thousands or millions)\n')
+	sys.stderr.write( '\t      -r <seed>  seed of the random numbers [default: 0]\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# ParseCount - parse a number with an optional K or M suffix (10K, 1M)
+###############################################################################
+
+def ParseCount(value):
+	value = value.strip().upper()
+	scale = 1
+	if value.endswith("K"):
+		scale = 1000
+		value = value[:-1]
+	elif value.endswith("M"):
+		scale = 1000000
+		value = value[:-1]
+	return int(float(value) * scale)
+
+# end of ParseCount()
+
+###############################################################################
+# WeightedChooser - chooses from a list of (value, weight)
+###############################################################################
+class WeightedChooser(object):
+
+	def __init__(self, rng, choices):
+		self.rng = rng
+		self.values = []
+		for value, weight in choices:
+			self.values.extend([value] * weight)
+
+	def __call__(self):
+		return self.values[int(self.rng.random() * len(self.values))]
+
+# end of WeightedChooser
+
+###############################################################################
+# ZipTable - the zip codes of each state and their ZCTA
+# Returns: (list of (zip, state, zcta), dict of state to list of zips)
+###############################################################################
+
+def ZipTable(rng):
+
+	table = []
+	state_zips = {}
+	for state, prefixes, n_zips in STATE_ZIPS:
+		zips = sorted(rng.sample(["%03d%02d"%(p, n) for p in prefixes for n in range(100)], n_zips))
+		state_zips[state] = zips
+		for i, zip in enumerate(zips):
+			zcta = zip
+			r = rng.random()
+			if (r < 0.05) and (i > 0):		# PO box zip codes share the ZCTA of a nearby zip
+				zcta = zips[i-1]
+			elif (r < 0.06):				# zip codes without a ZCTA
+				zcta = ""
+			table.append((zip, state, zcta))
+
+	return (table, state_zips)
+
+# end of ZipTable()
+
+###############################################################################
+# PatientZip - the zip code of a patient, as written in the lab export
+###############################################################################
+
+def PatientZip(rng, zip):
+
+	r = rng.random()
+	if (r < 0.15):
+		return "%s-%04d"%(zip, rng.randint(0, 9999))	# +4 suffix
+	if (r < 0.18):
+		return "%05d"%(rng.randint(0, 99999))			# usually not in the table
+	if (r < 0.20):
+		return ""
+	if (zip[0] == '0') and (r < 0.40):
+		return zip.lstrip('0')							# leading zeros lost by a spreadsheet
+	return zip
+
+# end of PatientZip()
+
+###############################################################################
+# DiagnosisText - a random diagnosis text
+###############################################################################
+
+def DiagnosisText(rng, choose_text, choose_species, choose_method):
+
+	text = choose_text() % {"s": choose_species(), "t": choose_species(), "m": choose_method()}
+	if (rng.random() < 0.02):
+		text = text.lower()
+	return text
+
+# end of DiagnosisText()
+
+###############################################################################
+# WriteLabRecords - write the lab export with about n_records records
+# Returns: list of the patient ids
+###############################################################################
+
+def WriteLabRecords(outfile, rng, n_records, state_zips):
+
+	choose_state = WeightedChooser(rng, PATIENT_STATES)
+	choose_column = WeightedChooser(rng, DIAGNOSIS_COLUMNS)
+	choose_text = WeightedChooser(rng, TEXTS)
+	choose_species = WeightedChooser(rng, SPECIES)
+	choose_method = WeightedChooser(rng, METHODS)
+	cities = {"CO": "DENVER", "FL": "MIAMI", "NJ": "NEWARK", "TX": "DALLAS"}
+
+	outfile.write(",".join(COLUMNS) + "\n")
+
+	patient_ids = []
+	patient_id = 1000000
+	n_written = 0
+	while (n_written < n_records):
+		patient_id += rng.randint(1, 20)
+		patient_ids.append("%d"%patient_id)
+
+		state = choose_state()
+		zip = PatientZip(rng, rng.choice(state_zips[state]))
+		age = rng.choice(["%d"%rng.randint(0, 99)] * 8 + ["", "UNKNOWN"])
+		gender = rng.choice(["F", "F", "M", "M", "U", ""])
+		race = rng.choice(["WHITE", "WHITE", "BLACK", "ASIAN", "OTHER", ""])
+		ethnicity = rng.choice(["NOT HISPANIC", "NOT HISPANIC", "HISPANIC", ""])
+		marital = rng.choice(["MARRIED", "SINGLE", "DIVORCED", "WIDOWED", ""])
+
+		n_patient = min(rng.randint(1, RECORDS_PER_PATIENT), n_records - n_written)
+		for r in xrange(n_patient):
+			cols = [""] * len(COLUMNS)
+			cols[0] = patient_ids[-1]
+			cols[1] = "A%08d"%(n_written)
+			cols[2] = rng.choice(["SPUTUM", "BRONCHIAL WASH", "TISSUE", "BLOOD"])
+			cols[3] = cities[state]
+			cols[4] = state
+			cols[5] = zip
+			cols[6] = marital
+			cols[7] = "%d-%02d-%02d"%(rng.randint(2010, 2017), rng.randint(1, 12), rng.randint(1, 28))
+			column = choose_column()
+			if (column != None):
+				cols[column] = DiagnosisText(rng, choose_text, choose_species, choose_method)
+			cols[12] = "AFB%d"%(rng.randint(1, 9))
+			cols[13] = "FINAL"
+			cols[14] = "LAB %d"%(rng.randint(1, 30))
+			cols[15] = age
+			cols[16] = gender
+			cols[17] = race
+			cols[18] = ethnicity
+			outfile.write(",".join(cols) + "\n")
+			n_written += 1
+
+	return patient_ids
+
+# end of WriteLabRecords()
+
+###############################################################################
+# WriteCategories - write the category files of the species
+###############################################################################
+
+def WriteCategories(out_dir):
+
+	rapid = ["ABSCESSUS", "ABSCESSUS_GROUP", "CHELONAE", "FORTUITUM", "MASSILIENSE", "MUCOGENICUM", "PEREGRINUM"]
+	slow = ["AVIUM", "AVIUM_COMPLEX", "INTRACELLULARE", "CHIMAERA", "KANSASII", "SIMIAE", "GORDONAE"]
+
+	with open(os.path.join(out_dir, "RAPID_SLOW_CATEGORIES.txt"), 'w') as outfile:
+		outfile.write("[RAPID]\n" + "".join(["M. %s\n"%s for s in rapid]) + "\n")
+		outfile.write("[SLOW]\n" + "".join(["M. %s\n"%s for s in slow]))
+
+	with open(os.path.join(out_dir, "INDIVIDUAL_CATEGORIES.txt"), 'w') as outfile:
+		for s in INDIVIDUAL_SPECIES:
+			outfile.write("[%s]\nM. %s\n\n"%(s, s))
+
+# end of WriteCategories()
+
+###############################################################################
+# WriteDataSet - write the files of a synthetic data set to out_dir
+###############################################################################
+
+def WriteDataSet(out_dir, n_records, seed=0):
+
+	if (not os.path.isdir(out_dir)):
+		os.makedirs(out_dir)
+	rng = random.Random(seed)
+
+	table, state_zips = ZipTable(rng)
+	with open(os.path.join(out_dir, ZCTA_TABLE), 'w') as outfile:
+		outfile.write("ZIP_CODE\tPO_NAME\tZIP_TYPE\tSTATE\tZCTA\n")
+		for zip, state, zcta in table:
+			outfile.write("%s\tCITY\tZIP CODE AREA\t%s\t%s\n"%(zip, state, zcta))
+
+	with open(os.path.join(out_dir, INPUT_FILE), 'w', OUTPUT_BUFFER_SIZE) as outfile:
+		patient_ids = WriteLabRecords(outfile, rng, n_records, state_zips)
+
+	with open(os.path.join(out_dir, CF_PATIENT_IDS), 'w') as outfile:
+		for patient_id in patient_ids:
+			if (rng.random() < CF_FRACTION):
+				outfile.write("%s,CF\n"%(patient_id))
+
+	WriteCategories(out_dir)
+
+	sys.stderr.write("Wrote %d records of %d patients to [%s]\n"%(n_records, len(patient_ids), os.path.join(out_dir, INPUT_FILE)))
+
+# end of WriteDataSet()
+
+###############################################################################
+#
+# Main application processing
+#
+###############################################################################
+
+def Main():
+
+	n_records = 10000
+	seed = 0
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "n:r:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-n':			n_records = ParseCount(value)
+		elif opt == '-r':			seed = int(value)
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	if (len(args) < 1):
+		Usage()
+		exit(-1)
+
+	WriteDataSet(args[0], n_records, seed)
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	Main()
+
+###############################################################################
+###############################################################################
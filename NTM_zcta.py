@@ -0,0 +1,351 @@
+# Mapping of zip codes to ZCTA (ZIP Code Tabulation Area) values
+#
+# Copyright (2011-2018) University of Colorado
+# All Rights Reserved
+#
+#	The mapping is parsed from the tab separated ZIP to ZCTA table
+#	(zipcodezctatable.txt) with columns:
+#		0	ZIP
+#		3	State
+#		4	ZCTA
+#
+#	The parsed table is saved in a compiled index file next to the table
+#	(<table>.idx), which is memory mapped by later runs instead of parsing
+#	the table again.  The index is rebuilt when the size or modification
+#	time of the table changes.
+#
+#	Index file format:
+#		header:	magic, table size, table mtime, width of ZCTA values, width of STATE values
+#		ZIP_SLOTS slots of [flag byte, ZCTA value] indexed by the 5 digit zip code
+#		ZIP_SLOTS slots of [flag byte, STATE value] indexed by the 5 digit ZCTA code
+#	Values are padded with '\0' to the width given in the header.
+#
+#	Usage: python NTM_zcta.py [-Z <ZIP to ZCTA table>]
+#		compiles the index of the table
+#
+
+import string
+import sys, os, re, getopt
+import mmap, struct
+import NTM_diagnostics
+from NTM_metrics import StartMetrics
+
+ZCTA_INDEX_MAGIC = "NTMZCTA1"
+ZCTA_INDEX_HEADER = "<8sqdii"
+ZIP_SLOTS = 100000
+
+###############################################################################
+
+def Usage():
+	sys.stderr.write( 'Usage: %s [options] \n'%(re.sub('^.*/','',sys.argv[0])))
+	sys.stderr.write( '\t Compiles the index of the ZIP to ZCTA table used by the NTM_* scripts.\n')
+	sys.stderr.write( '\t      -Z <filename>  load ZIP to ZCTA conversion data from given filename [default: zipcodezctatable.txt]\n')
+	sys.stderr.write( '\n')
+# end of Usage()
+
+###############################################################################
+# MappedTable - read only dictionary of 5 digit codes to values, stored in
+#	fixed width slots of a memory mapped index file.
+###############################################################################
+class MappedTable(object):
+
+	def __init__(self, data, offset, width):
+		self.data = data
+		self.offset = offset
+		self.slot_size = width + 1
+
+	def _slot(self, key):
+		if (len(key) != 5) or (not key.isdigit()):
+			return None
+		start = self.offset + int(key) * self.slot_size
+		if (self.data[start] != '\1'):
+			return None
+		return start
+
+	def __contains__(self, key):
+		return self._slot(key) != None
+
+	def __getitem__(self, key):
+		start = self._slot(key)
+		if (start == None):
+			raise KeyError(key)
+		return self.data[start+1:start+self.slot_size].rstrip('\0')
+
+# end of MappedTable
+
+###############################################################################
+# ParseZCTA - parse the ZIP to ZCTA table.
+# Returns: (dict of zip to ZCTA, dict of ZCTA to state)
+###############################################################################
+
+def ParseZCTA(fipstozcta_file):
+
+	zip_to_zcta = {}
+	zcta_to_state = {}
+
+	with open(fipstozcta_file, 'r') as infile:
+		header = infile.readline()
+		for line in infile:
+			fields = line.split('\t')
+			zip = fields[0].strip()
+			zcta = fields[4].strip()
+			zip_to_zcta[zip] = zcta
+
+			state = fields[3].strip()
+			zcta_to_state[zcta] = state
+
+	return (zip_to_zcta, zcta_to_state)
+
+# end of ParseZCTA()
+
+###############################################################################
+# IndexFilename - name of the compiled index for the given table
+###############################################################################
+
+def IndexFilename(fipstozcta_file):
+	return fipstozcta_file + ".idx"
+
+# end of IndexFilename()
+
+###############################################################################
+# WriteZCTAIndex - write the compiled index of the table.
+#	The index is written to a temporary file and renamed, so other processes
+#	never see a partial index.
+# Returns: True if the index was written.  Tables with keys that are not
+#	5 digit codes cannot be indexed.
+###############################################################################
+
+def WriteZCTAIndex(fipstozcta_file, zip_to_zcta, zcta_to_state):
+
+	zcta_width = 1
+	for zip in zip_to_zcta:
+		if (len(zip) != 5) or (not zip.isdigit()):
+			sys.stderr.write("Cannot index ZIP: (%s)\n"%(zip))
+			return False
+		zcta_width = max(zcta_width, len(zip_to_zcta[zip]))
+
+	state_width = 1
+	for zcta in zcta_to_state:
+		if (zcta == ""):
+			continue
+		if (len(zcta) != 5) or (not zcta.isdigit()):
+			sys.stderr.write("Cannot index ZCTA: (%s)\n"%(zcta))
+			return False
+		state_width = max(state_width, len(zcta_to_state[zcta]))
+
+	zip_slots = ['\0' * (zcta_width+1)] * ZIP_SLOTS
+	for zip in zip_to_zcta:
+		zip_slots[int(zip)] = '\1' + zip_to_zcta[zip].ljust(zcta_width, '\0')
+
+	state_slots = ['\0' * (state_width+1)] * ZIP_SLOTS
+	for zcta in zcta_to_state:
+		if (zcta != ""):
+			state_slots[int(zcta)] = '\1' + zcta_to_state[zcta].ljust(state_width, '\0')
+
+	st = os.stat(fipstozcta_file)
+	header = struct.pack(ZCTA_INDEX_HEADER, ZCTA_INDEX_MAGIC, st.st_size, st.st_mtime, zcta_width, state_width)
+
+	index_file = IndexFilename(fipstozcta_file)
+	tmp_file = "%s.%d"%(index_file, os.getpid())
+	try:
+		with open(tmp_file, 'wb') as outfile:
+			outfile.write(header)
+			outfile.write(''.join(zip_slots))
+			outfile.write(''.join(state_slots))
+		os.rename(tmp_file, index_file)
+	except (IOError, OSError), e:
+		sys.stderr.write("Unable to write ZCTA index [%s]: %s\n"%(index_file, e))
+		if os.path.exists(tmp_file):
+			os.remove(tmp_file)
+		return False
+
+	return True
+
+# end of WriteZCTAIndex()
+
+###############################################################################
+# MapZCTAIndex - memory map the compiled index of the table.
+# Returns: (zip to ZCTA table, ZCTA to state table) or None if there is no
+#	index that is up to date with the table.
+###############################################################################
+
+def MapZCTAIndex(fipstozcta_file):
+
+	index_file = IndexFilename(fipstozcta_file)
+	try:
+		st = os.stat(fipstozcta_file)
+		with open(index_file, 'rb') as infile:
+			data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+	except (IOError, OSError, ValueError):
+		return None
+
+	header_size = struct.calcsize(ZCTA_INDEX_HEADER)
+	if (len(data) < header_size):
+		return None
+	magic, size, mtime, zcta_width, state_width = struct.unpack(ZCTA_INDEX_HEADER, data[:header_size])
+	if (magic != ZCTA_INDEX_MAGIC) or (size != st.st_size) or (mtime != st.st_mtime):
+		return None
+	if (len(data) != header_size + ZIP_SLOTS * (zcta_width + state_width + 2)):
+		return None
+
+	zip_table = MappedTable(data, header_size, zcta_width)
+	state_table = MappedTable(data, header_size + ZIP_SLOTS * (zcta_width + 1), state_width)
+	return (zip_table, state_table)
+
+# end of MapZCTAIndex()
+
+###############################################################################
+# LoadZCTATables - load the mapping from zip to ZCTA value
+#		Data is read from the compiled index of the file whose name is
+#		given as a parameter, or parsed from the file (compiling the index).
+# Returns: (zip to ZCTA table, ZCTA to state table)
+###############################################################################
+
+def LoadZCTATables(fipstozcta_file):
+
+	tables = MapZCTAIndex(fipstozcta_file)
+	if (tables == None):
+		tables = ParseZCTA(fipstozcta_file)
+		if WriteZCTAIndex(fipstozcta_file, tables[0], tables[1]):
+			sys.stderr.write("Compiled ZCTA index [%s]\n"%(IndexFilename(fipstozcta_file)))
+	return tables
+
+# end of LoadZCTATables()
+
+###############################################################################
+# LoadZCTA - create mapping from zip to ZCTA value
+#		Creates a global variable to hold the data for mapping
+#		a zip code into ZCTA code (see LoadZCTATables)
+###############################################################################
+
+def LoadZCTA(fipstozcta_file):
+
+	global zip_to_zcta, zcta_to_state
+
+	zip_to_zcta, zcta_to_state = LoadZCTATables(fipstozcta_file)
+	return
+
+# end of LoadZCTA()
+
+###############################################################################
+# ZipToZCTA - Find the ZCTA value for the given zip code in the table
+#
+#	Strips zip down to 5 digit code.
+#	Looks up the 5 digit code in the mapping data structure.
+#	Makes sure the result is a 5 digit string with leading 0's
+###############################################################################
+def ZipToZCTA(zip_to_zcta, zip_str):
+
+	zip_whole = zip_str.strip()
+	zip = zip_whole.split("-")[0]
+	#print zip_whole + '\t' + zip
+
+	# pad out the zip to 5 digits with leading 0's
+	if zip.isdigit():
+		while (len(zip) < 5):
+			zip = "0"+zip
+
+	if zip in zip_to_zcta:
+		zcta = zip_to_zcta[zip]
+		if (zcta == ""):
+			NTM_diagnostics.current.Report("empty ZCTA for ZIP", zip, "empty ZCTA for ZIP: (%s)\n", zip)
+	else:
+		return None
+#		sys.stderr.write("Using unknown ZIP: (%s)\n"%(zip))
+#		zcta = zip
+
+	# pad out the code to 5 digits with leading 0's
+	if zcta.isdigit():
+		while (len(zcta) < 5):
+			zcta = "0"+zcta
+
+	return zcta
+
+# end of ZipToZCTA()
+
+###############################################################################
+# ZCTAToState - Find the STATE value for the given ZCTA code in the table
+###############################################################################
+def ZCTAToState(zcta_to_state, zcta):
+
+	state = None
+
+	if zcta in zcta_to_state:
+		state = zcta_to_state[zcta]
+		if (state == ""):
+			NTM_diagnostics.current.Report("empty STATE for ZCTA", zcta, "empty STATE for ZCTA: (%s)\n", zcta)
+	else:
+		NTM_diagnostics.current.Report("unknown ZCTA", zcta, "Using unknown ZCTA: (%s)\n", zcta)
+
+	return state
+
+# end of ZCTAToState()
+
+###############################################################################
+# Lookup_ZCTA - Find the ZCTA value for the given zip code
+#
+#	Uses the global mapping data structure created in LoadZCTA.
+###############################################################################
+def Lookup_ZCTA(zip_str):
+
+	global zip_to_zcta
+
+	return ZipToZCTA(zip_to_zcta, zip_str)
+
+# end of Lookup_ZCTA()
+
+###############################################################################
+# Lookup_ZCTA_State - Find the STATE value for the given ZCTA code
+#
+#	Uses the global mapping data structure created in LoadZCTA.
+###############################################################################
+def Lookup_ZCTA_State(zcta):
+
+	global zcta_to_state
+
+	return ZCTAToState(zcta_to_state, zcta)
+
+# end of Lookup_ZCTA_State()
+
+###############################################################################
+#
+# Main application processing - compile the index of the table
+#
+###############################################################################
+
+def Main():
+
+	metrics = StartMetrics()
+
+	filename_ZTAC = "zipcodezctatable.txt"
+
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "Z:", ["help"])
+	except getopt.GetoptError:
+		Usage()
+		sys.exit(1)
+
+	for opt, value in opts:
+		if	 opt == '-Z':			filename_ZTAC = value
+		else:
+			sys.stderr.write("Unhandled opt [%s][%s]\n"%(opt,value))
+
+	metrics.Switch("parse")
+	zip_to_zcta, zcta_to_state = ParseZCTA(filename_ZTAC)
+	metrics.Switch("write")
+	if not WriteZCTAIndex(filename_ZTAC, zip_to_zcta, zcta_to_state):
+		exit(-1)
+
+	sys.stderr.write("# ZIP codes: %d\n"%len(zip_to_zcta))
+	sys.stderr.write("# ZCTA:      %d\n"%len(zcta_to_state))
+	sys.stderr.write("Compiled ZCTA index [%s]\n"%(IndexFilename(filename_ZTAC)))
+
+###############################################################################
+#
+###############################################################################
+if __name__ == '__main__':
+
+	Main()
+
+###############################################################################
+###############################################################################
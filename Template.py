@@ -21,6 +21,7 @@
 
 import string
 import sys, re, os, getopt
+from NTM_read_data import OpenRecords, BufferedStdout
 
 
 ###############################################################################
@@ -62,19 +63,9 @@ def Main():
 
 	
 	# open a filename given on the command line.
-	fh=open(args[0])
+	reader = OpenRecords(args[0])
 
-	line_no = 0
-
-	for line in fh.readlines():
-		line_no += 1
-
-		sline = line.strip()
-		if (len(sline) < 2):
-			continue
-		
-		sline = sline.upper()
-		cols = sline.split(',')
+	for cols in reader:
 
 		print cols[0], "[%s, %s]"%(cols[2],cols[3])
 
@@ -82,15 +73,15 @@ def Main():
 		
 		
 		
-	sys.stderr.write("processe %d lines\n"%line_no)	
+	sys.stderr.write("processe %d lines\n"%reader.line_no)	
 
 ###############################################################################
 #
 ###############################################################################
 if __name__ == '__main__':
 
-	# reopen stdout file descriptor with write mode and 0 as the buffer size (unbuffered)
-	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
+	# reopen stdout with a large buffer, flushed at exit (instead of unbuffered)
+	BufferedStdout()
 
 	Main()
 	